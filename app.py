@@ -1,5 +1,4 @@
 import os
-import re
 import time
 import random
 import json
@@ -29,6 +28,26 @@ from utils.get_web_results import search_the_web, REGIONS
 from utils.get_web_results_serp import get_web_results
 from utils.get_location import find_closest_match
 from utils.agentic_search import generate_search_strings, agentic_search_crawler
+from utils.groq_client import get_groq_client, get_connection_stats
+from utils.rate_limits import get_router
+from utils.context_window import build_context, message_tokens, remaining_budget
+from utils.compaction import compact_history
+from utils.response_cache import (
+    is_cacheable,
+    response_cache_key,
+    get_cached_response,
+    cache_response,
+)
+from utils.semantic_cache import SEMANTIC_CACHE
+from utils.search_cache import get_search_cache_stats
+from utils.tokens import context_window
+from utils.streaming import (
+    CompletionStream,
+    HedgedCompletionStream,
+    REASONING_FIELD_MODELS,
+    THINK_TAG_MODELS,
+    split_think_tags,
+)
 
 voice_name_to_id = {
     "Jessica": {"id": "cgSgspJ2msm6clMCkdW9", "type": "Conversational"},
@@ -52,6 +71,19 @@ voice_name_to_id = {
     "Ethan": {"id": "g5CIjZEefAph4nQFvHAz", "type": "ASMR"},
 }
 
+chat_models = [
+    "gemma2-9b-it",
+    "llama-3.1-8b-instant",
+    "llama-3.3-70b-versatile",
+    "meta-llama/llama-4-maverick-17b-128e-instruct",
+    "meta-llama/llama-4-scout-17b-16e-instruct",
+    "openai/gpt-oss-120b",
+    "openai/gpt-oss-20b",
+    "deepseek-r1-distill-llama-70b",
+    "qwen/qwen3-32b",
+    "moonshotai/kimi-k2-instruct",
+]
+
 
 #! Text to Speech Function using ElevenLabs API
 #! -------------------------------------------------------------------------------------------------
@@ -618,6 +650,170 @@ def show_media(
 #! -------------------------------------------------------------------------------------------------
 
 
+#! Function to stream the model response
+#! -------------------------------------------------------------------------------------------------
+def stream_model_response(
+    client: Groq,
+    fallback_kwargs: dict = None,
+    hedge_deadline: float = None,
+    **create_kwargs,
+) -> tuple:
+    """
+    Streams the model response into a temporary chat message as the tokens arrive.
+
+    The reasoning (if any) is streamed into a collapsed expander and the answer is
+    rendered with `st.write_stream`. The time to first token is recorded in
+    `st.session_state.latency_log`.
+
+    Args:
+        client (Groq): The Groq client to use for the request.
+        fallback_kwargs (dict, optional): The request to race against the selected model
+            if it has not responded within `hedge_deadline` seconds.
+        hedge_deadline (float, optional): Seconds to wait for the first token before hedging.
+        **create_kwargs: Keyword arguments for `client.chat.completions.create`.
+
+    Returns
+        - completion_stream (CompletionStream | HedgedCompletionStream): The consumed stream holding the reasoning and the answer.
+        - placeholder (st.empty): The placeholder holding the streamed message, to be cleared once the final response is shown.
+    """
+    model = create_kwargs["model"]
+    models = [model] + ([fallback_kwargs["model"]] if fallback_kwargs else [])
+    placeholder = st.empty()
+    with placeholder.container():
+        with st.chat_message("assistant"):
+            reasoning_box = None
+            if any(
+                name in REASONING_FIELD_MODELS + THINK_TAG_MODELS for name in models
+            ):
+                with st.expander("Reasoning", expanded=False):
+                    reasoning_box = st.empty()
+
+            on_reasoning = reasoning_box.markdown if reasoning_box else None
+            if fallback_kwargs:
+                completion_stream = HedgedCompletionStream(
+                    client,
+                    fallback_kwargs=fallback_kwargs,
+                    deadline=hedge_deadline,
+                    on_reasoning=on_reasoning,
+                    **create_kwargs,
+                )
+            else:
+                completion_stream = CompletionStream(
+                    client,
+                    on_reasoning=on_reasoning,
+                    **create_kwargs,
+                )
+            st.write_stream(completion_stream)
+
+    if fallback_kwargs:
+        # ? Both sides of the race are logged to tune the hedge deadline
+        for latency in completion_stream.latencies:
+            st.session_state.latency_log.append(
+                dict(latency, hedge_deadline=hedge_deadline)
+            )
+        print(
+            f"Hedged request won by {completion_stream.model} "
+            f"(hedged: {completion_stream.hedged}): {completion_stream.latencies}"
+        )
+    else:
+        st.session_state.latency_log.append(
+            {
+                "model": model,
+                "ttft": completion_stream.ttft,
+                "total_time": completion_stream.total_time,
+            }
+        )
+        print(
+            f"Time to first token for {model}: {completion_stream.ttft}s "
+            f"(total {completion_stream.total_time}s)"
+        )
+    return completion_stream, placeholder
+
+
+#! End of Function to stream the model response
+#! -------------------------------------------------------------------------------------------------
+
+
+#! Functions to pick the semantic cache mode and scope of a prompt
+#! -------------------------------------------------------------------------------------------------
+def semantic_cache_mode(
+    prompt: str, model: str, turn_start: int, temperature: float, browsing: bool
+) -> str:
+    """
+    Returns the semantic cache mode of the current question, or None if its answer can't be shared.
+
+    Only standalone questions (the first of a chat) are shared, since follow up
+    questions depend on the history. Answers about YouTube videos, answers read
+    out loud, sampled answers and answers the model browsed for always go through
+    the model, as with the response cache. Answers built on the search results of
+    the app are shared within the (short) TTL of their mode.
+
+    Args:
+        prompt (str): The user input.
+        model (str): The model selected by the user.
+        turn_start (int): Index of the user prompt in `st.session_state.messages`.
+        temperature (float): The sampling temperature.
+        browsing (bool): Whether the model may browse the web (browser_search tool).
+
+    Returns:
+        str: One of the modes of `MODE_TTLS`, or None.
+    """
+    if turn_start > 1 or st.session_state.use_audio_output:
+        return None
+    if st.session_state.use_you_tube and filter_links(prompt):
+        return None
+    if not is_cacheable(temperature, live_data=browsing):
+        return None
+
+    if model.startswith("compound-beta"):
+        return "compound"
+    if st.session_state.search_the_web:
+        if (
+            st.session_state.use_serp_api
+            and st.session_state.serp_api_key
+            and st.session_state.serpapi_location
+        ):
+            return "serp"
+        if st.session_state.use_agentic_search:
+            return "agentic"
+        if st.session_state.use_plain_duckduckgo:
+            return "duckduckgo"
+    return "chat"
+
+
+def semantic_cache_scope(
+    mode: str, region: str, temperature: float, top_p: float, max_tokens: int
+) -> tuple:
+    """
+    Returns what else shapes the answer to a question in the given mode, besides the question itself.
+
+    Args:
+        mode (str): The semantic cache mode of the question.
+        region (str): The region selected by the user.
+        temperature (float): The sampling temperature.
+        top_p (float): The nucleus sampling probability.
+        max_tokens (int): The maximum number of tokens of the answer.
+
+    Returns:
+        tuple: The system prompt, the sampling parameters, and the search location
+            (SerpApi) or region (DuckDuckGo).
+    """
+    system_prompt = next(
+        (m["content"] for m in st.session_state.messages if m["role"] == "system"),
+        "",
+    )
+    scope = (system_prompt, temperature, top_p, max_tokens)
+    if mode == "serp":
+        return scope + (st.session_state.serpapi_location,)
+    if mode in ("agentic", "duckduckgo"):
+        return scope + (region,)
+    return scope
+
+
+#! End of Functions to pick the semantic cache mode and scope of a prompt
+#! -------------------------------------------------------------------------------------------------
+
+
 def sidebar_and_init() -> tuple:
     """
     Defines the sidebar and initializes the session state variables.
@@ -771,6 +967,30 @@ def sidebar_and_init() -> tuple:
     if "use_compound_beta" not in st.session_state:
         st.session_state.use_compound_beta = False
 
+    if "stream_responses" not in st.session_state:
+        st.session_state.stream_responses = True
+
+    if "latency_log" not in st.session_state:
+        st.session_state.latency_log = []
+
+    if "context_budget" not in st.session_state:
+        st.session_state.context_budget = None
+
+    if "context_epoch" not in st.session_state:
+        st.session_state.context_epoch = 0
+
+    if "compact_history" not in st.session_state:
+        st.session_state.compact_history = False
+
+    if "hedge_requests" not in st.session_state:
+        st.session_state.hedge_requests = False
+
+    if "hedge_model" not in st.session_state:
+        st.session_state.hedge_model = "llama-3.1-8b-instant"
+
+    if "hedge_deadline" not in st.session_state:
+        st.session_state.hedge_deadline = 2.0
+
     st.session_state.page_reload_count += (
         1  # will be incremented each time streamlit reruns the script
     )
@@ -878,18 +1098,7 @@ def sidebar_and_init() -> tuple:
         else:
             model = st.selectbox(
                 "Select Model",
-                [
-                    "gemma2-9b-it",
-                    "llama-3.1-8b-instant",
-                    "llama-3.3-70b-versatile",
-                    "meta-llama/llama-4-maverick-17b-128e-instruct",
-                    "meta-llama/llama-4-scout-17b-16e-instruct",
-                    "openai/gpt-oss-120b",
-                    "openai/gpt-oss-20b",
-                    "deepseek-r1-distill-llama-70b",
-                    "qwen/qwen3-32b",
-                    "moonshotai/kimi-k2-instruct",
-                ],
+                chat_models,
                 index=6,
             )
 
@@ -1061,6 +1270,55 @@ def sidebar_and_init() -> tuple:
         else:
             top_p = 0.8  #! Hardcoded to 0.8 for audio input to refrain from sending multiple requests to the API
 
+        st.toggle(
+            "Stream Responses",
+            key="stream_responses",
+            help="Show the response as it is being generated.",
+        )
+
+        if st.session_state.stream_responses and model in chat_models:
+            st.toggle(
+                "Hedge Slow Requests",
+                key="hedge_requests",
+                help="""If the selected model has not started responding within the
+                deadline, the same request is also sent to the fallback model and
+                the first one to respond is shown.""",
+            )
+            if st.session_state.hedge_requests:
+                fallback_models = [name for name in chat_models if name != model]
+                if st.session_state.hedge_model not in fallback_models:
+                    st.session_state.hedge_model = fallback_models[0]
+                st.selectbox(
+                    "Fallback Model",
+                    fallback_models,
+                    key="hedge_model",
+                )
+                st.slider(
+                    "Hedge Deadline (seconds)",
+                    0.5,
+                    10.0,
+                    step=0.5,
+                    key="hedge_deadline",
+                    help="Seconds to wait for the first token before hedging.",
+                )
+
+        st.session_state.context_budget = st.slider(
+            "Context Budget",
+            1024,
+            context_window(model),
+            context_window(model),
+            256,
+            help="""The maximum tokens of chat history sent along with each message.
+            The oldest messages are left out first once the budget is reached.""",
+        )
+
+        st.toggle(
+            "Compact History",
+            key="compact_history",
+            help="""Summarize older turns of long chats into a short memory
+            to keep the responses fast.""",
+        )
+
         #! Logic to clear the chat history, remove any audio files generated, reinitialize the toggles and reload the page
         if len(st.session_state.clear_chat_tracker) > 0:
             if st.session_state.clear_chat_tracker[
@@ -1358,12 +1616,14 @@ def sidebar_and_init() -> tuple:
         #         )
 
         if st.button("Clear Chat"):
-            st.session_state.messages.append(
+            # ? Start a new context epoch, nothing before this point is sent again
+            st.session_state.messages = [
                 {
                     "role": "system",
                     "content": st.session_state.fast_chat_instructions,
                 }
-            )
+            ]
+            st.session_state.context_epoch += 1
 
             st.session_state.display_message = [
                 {
@@ -1489,6 +1749,7 @@ def body(
     maps_search_results = None
     final_response = None
     reasoning = None
+    stream_placeholder = None
 
     if (
         prompt and st.session_state.show_file_uploader
@@ -1521,7 +1782,7 @@ def body(
 
                         try:
                             with st.spinner("Processing the image..."):
-                                client = Groq(api_key=st.session_state.groq_api_key)
+                                client = get_groq_client(st.session_state.groq_api_key)
 
                                 chat_completion = client.chat.completions.create(
                                     model=model,
@@ -1762,9 +2023,8 @@ def body(
             st.session_state.is_elevenlabs_api_key_valid = False
         else:
             try:
-                client = Groq(
-                    api_key=st.session_state.groq_api_key,
-                )
+                client = get_groq_client(st.session_state.groq_api_key)
+                turn_start = len(st.session_state.messages)
                 st.session_state.messages.append({"role": "user", "content": prompt})
                 st.session_state.display_message.append(
                     {
@@ -1788,6 +2048,25 @@ def body(
                     model_output=prompt,
                 )
 
+                # ? Paraphrases of an earlier standalone question reuse its answer (and skip the search)
+                turn_started_at = time.perf_counter()
+                semantic_mode = semantic_cache_mode(
+                    prompt,
+                    model,
+                    turn_start,
+                    temperature,
+                    browsing=model in ("openai/gpt-oss-20b", "openai/gpt-oss-120b")
+                    and gpt_oss_tool1 is True,
+                )
+                semantic_hit = None
+                if semantic_mode:
+                    semantic_scope = semantic_cache_scope(
+                        semantic_mode, region, temperature, top_p, max_tokens
+                    )
+                    semantic_hit = SEMANTIC_CACHE.lookup(
+                        prompt, model, semantic_mode, semantic_scope
+                    )
+
                 # check if the prompt contains a youtube link and user asked something related to the video
                 prompt_modified_list = None
                 video_links = filter_links(prompt)
@@ -1816,7 +2095,7 @@ def body(
                     ]
                 )
 
-                if st.session_state.search_the_web:
+                if st.session_state.search_the_web and semantic_hit is None:
                     with st.spinner("Searching the web..."):
                         if (  # ? Deep Search Integration with SerpApi
                             st.session_state.use_serp_api
@@ -1837,6 +2116,14 @@ def body(
                                 query=prompt,
                                 location=st.session_state.serpapi_location,
                                 max_results=max_results,
+                                # ? The crawled results are packed to fit what the turn leaves of the context
+                                token_budget=remaining_budget(
+                                    st.session_state.messages,
+                                    model,
+                                    max_tokens=max_tokens,
+                                    budget=st.session_state.context_budget,
+                                    turn_start=turn_start,
+                                ),
                             )
                         elif (
                             st.session_state.use_agentic_search
@@ -1949,27 +2236,150 @@ def body(
                                 }
                             )
 
+                context_source, context_turn_start = (
+                    st.session_state.messages,
+                    turn_start,
+                )
+                if st.session_state.compact_history:
+                    # ? Older turns are replaced by a memory block summarized in the background
+                    context_source, context_turn_start = compact_history(
+                        st.session_state.messages,
+                        api_key=st.session_state.groq_api_key,
+                        epoch=st.session_state.context_epoch,
+                        turn_start=turn_start,
+                    )
+
+                # ? Only send as much of the history as fits the context budget of the model
+                context_messages = build_context(
+                    context_source,
+                    model,
+                    max_tokens=max_tokens,
+                    budget=st.session_state.context_budget,
+                    turn_start=context_turn_start,
+                )
+
+                tools = []
+                if model in ("openai/gpt-oss-20b", "openai/gpt-oss-120b"):
+                    if gpt_oss_tool1 is True:
+                        tools.append({"type": "browser_search"})
+                    if gpt_oss_tool2 is True:
+                        tools.append({"type": "code_interpreter"})
+
+                # ? Only deterministic answers without live data (search results, browsing) are replayed
+                cache_key = None
+                cached_response = None
+                if is_cacheable(
+                    temperature,
+                    live_data=st.session_state.search_the_web
+                    or model.startswith("compound-beta")
+                    or {"type": "browser_search"} in tools,
+                ):
+                    cache_key = response_cache_key(
+                        model,
+                        context_messages,
+                        temperature,
+                        top_p,
+                        max_tokens,
+                        tools,
+                    )
+                    if semantic_hit is None:
+                        cached_response = get_cached_response(cache_key)
+
                 if (
                     st.session_state.use_agentic_search
                     and st.session_state.search_the_web
+                    and semantic_hit is None
+                    and cached_response is None
                 ):
-                    with st.spinner(
-                        "Waiting for 10 seconds to reduce the rate limit error..."
-                    ):
-                        time.sleep(10)
+                    # ? Only wait as long as the rate limit budget of the model requires
+                    router = get_router(st.session_state.groq_api_key)
+                    prompt_tokens = sum(
+                        message_tokens(message) for message in context_messages
+                    )
+                    rate_limit_delay = router.limits(model).seconds_until(prompt_tokens)
+                    if rate_limit_delay > 0:
+                        with st.spinner(
+                            f"Waiting {rate_limit_delay:.0f} seconds to reduce the rate limit error..."
+                        ):
+                            router.acquire(model, prompt_tokens)
+                    else:
+                        router.acquire(model, prompt_tokens)
                 # Give some feedback to the user while the model is generating the response
                 with st.spinner(spinner_message):
                     try:
-                        if model in ("openai/gpt-oss-20b", "openai/gpt-oss-120b"):
+                        response_model = model
+                        if semantic_hit is not None:
+                            model_output = semantic_hit["model_output"]
+                            final_response = semantic_hit["final_response"]
+                            reasoning = semantic_hit["reasoning"]
+                            img_links = semantic_hit["img_links"]
+                            video_links = semantic_hit["video_links"]
+                            MARKDOWN_PLACEHOLDER = semantic_hit["MARKDOWN_PLACEHOLDER"]
+                            related_questions = semantic_hit["related_questions"]
+                            maps_search_results = semantic_hit["maps_search_results"]
+                            print(
+                                f"Semantic cache hit for {model} ({semantic_mode}), "
+                                f"hit rate {SEMANTIC_CACHE.hit_rate():.0%}, "
+                                f"{SEMANTIC_CACHE.stats['time_saved']:.1f}s saved so far"
+                            )
+
+                        elif cached_response is not None:
+                            # ? An identical request was answered before, replay it instantly
+                            model_output, final_response, reasoning = cached_response
+                            print(f"Response cache hit for {model}")
+
+                        elif st.session_state.stream_responses:
+                            # ? Render the tokens as they arrive instead of waiting for the whole response
+                            create_kwargs = {
+                                "model": model,
+                                "messages": context_messages,
+                                "temperature": temperature,
+                                "max_tokens": max_tokens,
+                                "top_p": top_p,
+                            }
+                            if tools:
+                                create_kwargs["tools"] = tools
+
+                            fallback_kwargs = None
+                            if (
+                                st.session_state.hedge_requests
+                                and model in chat_models
+                                and st.session_state.hedge_model != model
+                            ):
+                                hedge_model = st.session_state.hedge_model
+                                fallback_kwargs = dict(
+                                    create_kwargs,
+                                    model=hedge_model,
+                                    messages=build_context(
+                                        context_source,
+                                        hedge_model,
+                                        max_tokens=max_tokens,
+                                        budget=st.session_state.context_budget,
+                                        turn_start=context_turn_start,
+                                    ),
+                                )
+                                if hedge_model not in REASONING_FIELD_MODELS:
+                                    fallback_kwargs.pop("tools", None)
+
+                            completion_stream, stream_placeholder = (
+                                stream_model_response(
+                                    client,
+                                    fallback_kwargs=fallback_kwargs,
+                                    hedge_deadline=st.session_state.hedge_deadline,
+                                    **create_kwargs,
+                                )
+                            )
+                            # ? The fallback answer must not be replayed for the selected model
+                            response_model = completion_stream.model
+                            model_output = completion_stream.model_output
+                            final_response = completion_stream.content
+                            reasoning = completion_stream.reasoning
+
+                        elif model in ("openai/gpt-oss-20b", "openai/gpt-oss-120b"):
                             # ? Use the OpenAI gpt oss
-                            tools = []
-                            if gpt_oss_tool1 is True:
-                                tools.append({"type": "browser_search"})
-                            if gpt_oss_tool2 is True:
-                                tools.append({"type": "code_interpreter"})
                             chat_completion = client.chat.completions.create(
                                 model=model,
-                                messages=st.session_state.messages,
+                                messages=context_messages,
                                 temperature=temperature,
                                 max_tokens=max_tokens,
                                 top_p=top_p,
@@ -2001,25 +2411,19 @@ def body(
 
                             chat_completion = client.chat.completions.create(
                                 model=model,
-                                messages=st.session_state.messages,
+                                messages=context_messages,
                                 temperature=temperature,
                                 max_tokens=max_tokens,
                                 top_p=top_p,
                             )
 
                             model_output = chat_completion.choices[0].message.content
-                            parts = re.findall(
-                                r"<think>\s*([\s\S]*?)\s*</think>\s*([\s\S]*?)$",
-                                model_output,
-                            )
-
-                            reasoning, final_response = parts[0]
-                            reasoning = "" if reasoning is None else reasoning
+                            reasoning, final_response = split_think_tags(model_output)
 
                         else:  # ? for non reasoning models
                             chat_completion = client.chat.completions.create(
                                 model=model,
-                                messages=st.session_state.messages,
+                                messages=context_messages,
                                 temperature=temperature,
                                 max_tokens=max_tokens,
                                 top_p=top_p,
@@ -2029,6 +2433,42 @@ def body(
                                 0
                             ].message.content
 
+                        if not final_response and reasoning:
+                            # ? The reasoning never reached an answer (e.g. max tokens hit within <think>),
+                            # ? so it is kept as reasoning rather than shown as the answer
+                            st.warning(
+                                "The model stopped before giving an answer. Try increasing the max tokens."
+                            )
+
+                        if (
+                            final_response
+                            and cached_response is None
+                            and semantic_hit is None
+                            and response_model == model
+                        ):
+                            if cache_key is not None:
+                                cache_response(
+                                    cache_key, model_output, final_response, reasoning
+                                )
+                            if semantic_mode:
+                                SEMANTIC_CACHE.store(
+                                    prompt,
+                                    model,
+                                    semantic_mode,
+                                    {
+                                        "model_output": model_output,
+                                        "final_response": final_response,
+                                        "reasoning": reasoning,
+                                        "img_links": img_links,
+                                        "video_links": video_links,
+                                        "MARKDOWN_PLACEHOLDER": MARKDOWN_PLACEHOLDER,
+                                        "related_questions": related_questions,
+                                        "maps_search_results": maps_search_results,
+                                    },
+                                    cost=time.perf_counter() - turn_started_at,
+                                    scope=semantic_scope,
+                                )
+
                         # Keep track of the model's output for the model's future reference
                         st.session_state.messages.append(
                             {
@@ -2175,6 +2615,9 @@ def body(
                 st.session_state.is_elevenlabs_api_key_valid = False
                 print(err)
 
+    if stream_placeholder is not None:
+        stream_placeholder.empty()  # ? The final response is rendered by `show_media`
+
     return (
         img_links,
         video_links,
@@ -2225,9 +2668,7 @@ if __name__ == "__main__":
 
         abs_path = os.path.join(os.path.dirname(__file__), FILE_NAME)
 
-        whisper_client = Groq(
-            api_key=st.session_state.groq_api_key,
-        )
+        whisper_client = get_groq_client(st.session_state.groq_api_key)
 
         if os.path.exists(FILE_NAME) and len(audio_data) > 0:
             with st.spinner("Transcribing the audio..."):
@@ -2408,6 +2849,8 @@ if __name__ == "__main__":
             payload,
             *sidebar_values,
         )
+        print(f"Groq connection stats: {get_connection_stats()}")
+        print(f"Search cache stats: {get_search_cache_stats()}")
 
         show_media(
             "assistant",
@@ -0,0 +1,73 @@
+"""
+Micro-benchmark of the page encoding resolution of `utils.deep_search`.
+
+Compares `chardet.detect` over the whole page (the previous behaviour) with
+`resolve_encoding` on pages with a charset header, a <meta charset> and no
+declaration at all.
+
+Usage:
+    python -m benchmarks.charset_benchmark [--pages 20] [--size-kb 300]
+"""
+
+import time
+import argparse
+
+import chardet
+
+from utils.deep_search import resolve_encoding
+
+PARAGRAPH = (
+    "<p>The quick brown fox jumps over the lazy dog near the café, while the "
+    "naïve reporter writes about the résumé of the jalapeño vendor.</p>\n"
+)
+
+
+def make_page(size_kb: int, encoding: str, meta: bool) -> bytes:
+    head = f'<meta charset="{encoding}">' if meta else ""
+    body = PARAGRAPH * (size_kb * 1024 // len(PARAGRAPH) + 1)
+    return f"<html><head>{head}</head><body>{body}</body></html>".encode(encoding)
+
+
+def timed(function, pages: list) -> float:
+    """Returns the average milliseconds per page."""
+    started_at = time.perf_counter()
+    for page in pages:
+        function(page)
+    return (time.perf_counter() - started_at) * 1000 / len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--size-kb", type=int, default=300)
+    args = parser.parse_args()
+
+    cases = {
+        "charset header": (
+            [make_page(args.size_kb, "utf-8", meta=False)] * args.pages,
+            "utf-8",
+        ),
+        "<meta charset>": (
+            [make_page(args.size_kb, "cp1252", meta=True)] * args.pages,
+            None,
+        ),
+        "undeclared utf-8": (
+            [make_page(args.size_kb, "utf-8", meta=False)] * args.pages,
+            None,
+        ),
+        "undeclared cp1252": (
+            [make_page(args.size_kb, "cp1252", meta=False)] * args.pages,
+            None,
+        ),
+    }
+
+    print(f"{args.pages} pages of ~{args.size_kb}KB, milliseconds per page\n")
+    print(f"{'case':<20}{'chardet (whole)':>18}{'resolve_encoding':>18}{'speedup':>10}")
+    for name, (pages, header_charset) in cases.items():
+        before = timed(lambda page: chardet.detect(page)["encoding"], pages)
+        after = timed(lambda page: resolve_encoding(page, header_charset), pages)
+        print(f"{name:<20}{before:>18.2f}{after:>18.3f}{before / after:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
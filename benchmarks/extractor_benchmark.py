@@ -0,0 +1,106 @@
+"""
+Micro-benchmark of the HTML extractor backends of `utils.html_extractors`.
+
+Parses every page of a local HTML corpus with each installed backend and reports
+the parse time per page, along with how many paragraphs each backend kept. The
+`bs4 (previous)` row is the extraction as it was before the backends existed.
+Without a corpus directory, synthetic article pages are generated.
+
+Usage:
+    python -m benchmarks.extractor_benchmark [corpus_dir] [--pages 20] [--size-kb 300]
+"""
+
+import re
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from utils.html_extractors import EXTRACTORS, extract_paragraphs
+
+ARTICLE = (
+    '<div class="post"><h2>Section {i}</h2>\n'
+    "<p>The quick brown fox jumps over the <a href='/fox'>lazy dog</a> near the "
+    "café, while the naïve reporter writes about the <b>résumé</b> of the vendor.</p>\n"
+    "<p>Short caption {i}</p>\n"
+    "<ul><li><a href='/a'>Home</a></li><li><a href='/b'>About</a></li></ul>\n"
+    "<p>\n    Indented paragraph {i} spread over\n    several lines with   odd "
+    "spacing, as produced by most templating engines out there.\n</p></div>\n"
+)
+
+
+def make_page(size_kb: int) -> str:
+    body, i = [], 0
+    while sum(map(len, body)) < size_kb * 1024:
+        body.append(ARTICLE.format(i=i))
+        i += 1
+    return f"<html><head><title>Page</title></head><body>{''.join(body)}</body></html>"
+
+
+def load_corpus(corpus_dir: str) -> list:
+    return [
+        path.read_text(encoding="utf-8", errors="replace")
+        for path in sorted(Path(corpus_dir).rglob("*.htm*"))
+    ]
+
+
+def previous_extractor(html: str) -> list:
+    """The BeautifulSoup extraction used before the pluggable backends."""
+    soup = BeautifulSoup(html, "html.parser")
+    paragraphs = []
+    for p in soup.find_all("p"):
+        text = p.get_text().strip()
+        basic_cleaned_text = re.sub(
+            r"^\s+?", "", re.sub("\n", "", re.sub(r"\s+", " ", text))
+        )
+        if len(basic_cleaned_text.split()) > 10:
+            paragraphs.append(basic_cleaned_text)
+    return paragraphs
+
+
+def timed(function, pages: list) -> tuple:
+    """Returns the median and worst milliseconds per page, and the paragraphs kept overall."""
+    durations, kept = [], 0
+    for page in pages:
+        started_at = time.perf_counter()
+        kept += len(function(page))
+        durations.append((time.perf_counter() - started_at) * 1000)
+    return statistics.median(durations), max(durations), kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("corpus_dir", nargs="?", help="Directory of .html files")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--size-kb", type=int, default=300)
+    args = parser.parse_args()
+
+    if args.corpus_dir:
+        pages = load_corpus(args.corpus_dir)
+        source = f"{len(pages)} pages from {args.corpus_dir}"
+    else:
+        pages = [make_page(args.size_kb)] * args.pages
+        source = f"{args.pages} synthetic pages of ~{args.size_kb}KB"
+    if not pages:
+        parser.error("no .html files found")
+
+    backends = {"bs4 (previous)": previous_extractor}
+    for name in EXTRACTORS:
+        backends[name] = lambda page, name=name: extract_paragraphs(page, name)
+
+    print(f"{source}, milliseconds per page\n")
+    print(f"{'backend':<16}{'median':>10}{'max':>10}{'paragraphs':>12}{'speedup':>10}")
+    baseline = None
+    for name, function in backends.items():
+        median, worst, kept = timed(function, pages)
+        baseline = baseline or median
+        print(
+            f"{name:<16}{median:>10.2f}{worst:>10.2f}{kept:>12}"
+            f"{baseline / median:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
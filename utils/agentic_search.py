@@ -1,17 +1,26 @@
 import os
 import re
-import random
-import time
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import groq
-from groq import Groq
 from duckduckgo_search import DDGS
-from duckduckgo_search.exceptions import TimeoutException, DuckDuckGoSearchException
+from duckduckgo_search.exceptions import (
+    TimeoutException,
+    DuckDuckGoSearchException,
+    RatelimitException,
+)
 
 from utils.deep_search import fetch_text
+from utils.dedup import ParagraphDeduplicator
 from utils.extract_subs import filter_links
+from utils.groq_client import get_groq_client
+from utils.rate_limits import get_router, SEARCH_PACER
+from utils.tokens import estimate_tokens
+from utils.passage_packer import fit_sentences
+from utils.streaming import THINK_TAG_MODELS, split_think_tags
 
 # Set up logging
 logging.basicConfig(
@@ -89,16 +98,137 @@ REGIONS = {
     "No region": "wt-wt",
 }
 
+# (model, max_tokens) pairs the agentic search can route its requests to
+AGENTIC_MODELS = [
+    ("llama-3.1-8b-instant", 8000),
+    ("llama-3.3-70b-versatile", 32768),
+    ("openai/gpt-oss-120b", 32766),
+    ("openai/gpt-oss-20b", 32768),
+    ("meta-llama/llama-4-maverick-17b-128e-instruct", 8192),
+    ("meta-llama/llama-4-scout-17b-16e-instruct", 8192),
+    ("deepseek-r1-distill-llama-70b", 131072),
+    ("moonshotai/kimi-k2-instruct", 16384),
+    ("qwen/qwen3-32b", 40960),
+]
+
+# Search queries crawled at once across all the objectives of a plan
+MAX_CONCURRENT_QUERIES = 4
+# DuckDuckGo calls in flight at once (the rest of a query is crawling and parsing)
+MAX_CONCURRENT_DDGS_CALLS = 2
+
+_QUERY_EXECUTOR = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_QUERIES, thread_name_prefix="agentic-query"
+)
+_OBJECTIVE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=3, thread_name_prefix="agentic-objective"
+)
+_DDGS_SLOTS = threading.BoundedSemaphore(MAX_CONCURRENT_DDGS_CALLS)
+
+# Crawled content too large for one prompt is summarized in chunks (map), and the
+# partial summaries are then merged (reduce)
+MAP_SUMMARY_TOKENS = 1024
+MAX_CONCURRENT_SUMMARIES = 4
+_SUMMARY_EXECUTOR = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_SUMMARIES, thread_name_prefix="agentic-summary"
+)
 
-def summarize(
+_INFO_BLOCK = re.compile(r"<info>(.*?)\n?</info>", re.DOTALL)
+
+
+def _distillation_prompt(content_from_links, objective) -> str:
+    return f"""
+                #Distillation objective:
+    `           {objective}
+
+                #Additional instructions:
+                - Retain all relevant descriptive information from the search content.
+                - Include specific details such as numerical data, technical specifications, and feature comparisons.
+                - Highlight any unique selling points or standout characteristics of the options being compared.
+                - Present a balanced view, including both positive and negative aspects when available.
+                - If certain important information is missing, note its absence.
+                - Do not include any advertisements, sponsored content and disregard any irrelevant information that deviates from the distillation objective.
+                - Distill the information as much as possible while maintaining clarity and coherence with respect to the distillation objective on the given search content.
+
+                #Search content:
+                {content_from_links}
+
+                Based on the above objective and search content, provide a comprehensive distillation of the information, ensuring to include all relevant details and comparisons.
+                """
+
+
+def split_into_chunks(content_from_links, chunk_tokens) -> list:
+    """
+    ## Split crawled content into chunks that each fit a prompt.
+
+    Chunks are cut on source boundaries (the `<info>` block of each search query).
+    A source too large for one chunk is cut between its paragraphs, and a paragraph
+    too large for one chunk between its sentences. Every piece keeps the header
+    of its source.
+
+    ---
+
+    **Args**
+        - **content_from_links (str)**: The crawled content, as `<info>` blocks.
+        - **chunk_tokens (int)**: The most tokens of content per chunk.
+
+    ---
+
+    **Returns**
+        - **chunks (list)**: The chunks, in the order of the content.
+    """
+    sources = _INFO_BLOCK.findall(content_from_links) or [content_from_links]
+
+    pieces = []
+    for source in sources:
+        if estimate_tokens(source) <= chunk_tokens:
+            pieces.append(f"<info>{source}\n</info>")
+            continue
+
+        header, _, body = source.partition("\n")
+        budget = max(64, chunk_tokens - estimate_tokens(header) - 8)  # ? Minus the tags
+        part, used = [], 0
+        for paragraph in body.split("\n"):
+            while paragraph:
+                tokens = estimate_tokens(paragraph)
+                if used + tokens <= budget:
+                    part.append(paragraph)
+                    used += tokens
+                    break
+                if not part:  # ? A single paragraph larger than a chunk
+                    head, _ = fit_sentences(paragraph, budget)
+                    head = (
+                        head or paragraph[: budget * 4]
+                    )  # ? Or a single huge sentence
+                    part.append(head)
+                    paragraph = paragraph[len(head) :].lstrip()
+                pieces.append(f"<info>{header}\n" + "\n".join(part) + "\n</info>")
+                part, used = [], 0
+        if part:
+            pieces.append(f"<info>{header}\n" + "\n".join(part) + "\n</info>")
+
+    chunks, chunk, used = [], [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if chunk and used + tokens > chunk_tokens:
+            chunks.append("\n".join(chunk))
+            chunk, used = [], 0
+        chunk.append(piece)
+        used += tokens
+    if chunk:
+        chunks.append("\n".join(chunk))
+    return chunks
+
+
+def distill(
     content_from_links,
     model,
     max_tokens,
     api_key,
     objective="Summarize the following information crawled from several websites",
+    reserved=False,
 ) -> str:
     """
-    ## Summarize the information from the search results.
+    ## Distill content that fits a single prompt of the model.
 
     ---
 
@@ -108,6 +238,7 @@ def summarize(
         - **max_tokens (int)**: The maximum number of tokens for the summarization.
         - **api_key (str)**: The API key for Groq API.
         - **objective (str)**: The objective for summarization.
+        - **reserved (bool)**: Whether the rate limit budget of the request was already reserved (by `pick`).
 
     ---
 
@@ -116,35 +247,25 @@ def summarize(
     """
     distilled_info = """"""
 
-    client = Groq(api_key=api_key)
+    client = get_groq_client(api_key)
 
     try:
         messages = [
             {  #! Note that `Distillation` objective is the `Final` Objective
                 "role": "user",
-                "content": f"""
-                #Distillation objective:
-    `           {objective}
-
-                #Additional instructions:
-                - Retain all relevant descriptive information from the search content.
-                - Include specific details such as numerical data, technical specifications, and feature comparisons.
-                - Highlight any unique selling points or standout characteristics of the options being compared.
-                - Present a balanced view, including both positive and negative aspects when available.
-                - If certain important information is missing, note its absence.
-                - Do not include any advertisements, sponsored content and disregard any irrelevant information that deviates from the distillation objective.
-                - Distill the information as much as possible while maintaining clarity and coherence with respect to the distillation objective on the given search content.
-
-                #Search content:
-                {content_from_links}
-
-                Based on the above objective and search content, provide a comprehensive distillation of the information, ensuring to include all relevant details and comparisons.
-                """,
+                "content": _distillation_prompt(content_from_links, objective),
             }
         ]
+        prompt_tokens = estimate_tokens(messages[0]["content"])
+        router = get_router(api_key)
+        # ? Groq counts the requested response against the context and the tokens per minute
+        max_tokens = max(
+            256, min(max_tokens, router.max_request_tokens(model) - prompt_tokens)
+        )
 
-        print("\n\n Waiting for 2 seconds before summarizing\n\n")
-        time.sleep(2)
+        #! Only wait if the rate limit budget of the model requires it
+        if not reserved:
+            router.acquire(model, prompt_tokens + max_tokens)
 
         #! Make this model constant by passing a parameter to the function
         print(f"\n\nModel selected for summarizing: {model}\n\n")
@@ -159,16 +280,11 @@ def summarize(
             stop=None,
             seed=42,
         )
-        if model in ("qwen/qwen3-32b", "deepseek-r1-distill-llama-70b"):
-            content = response.choices[0].message.content
-            parts = re.findall(
-                r"<think>\s*([\s\S]*?)\s*</think>\s*([\s\S]*?)$", content
+        if model in THINK_TAG_MODELS:
+            _, final_response = split_think_tags(response.choices[0].message.content)
+            distilled_info += (
+                final_response  # ? Empty if the <think> block never closed
             )
-            if parts:
-                _, final_response = parts[0]
-                distilled_info += final_response.strip()
-            else:
-                distilled_info += content.strip()
         else:
             distilled_info += response.choices[0].message.content
 
@@ -191,23 +307,183 @@ def summarize(
         return distilled_info
 
 
+def summarize(
+    content_from_links,
+    model,
+    max_tokens,
+    api_key,
+    objective="Summarize the following information crawled from several websites",
+    reserved=False,
+) -> str:
+    """
+    ## Summarize the information from the search results.
+
+    Content that fits one request of the model is distilled in a single request.
+    Larger content is split on source boundaries into chunks sized for the model
+    (its context window, or its tokens per minute if smaller, since Groq rejects
+    requests larger than that),
+    the chunks are summarized concurrently (each waiting on the rate limit budget
+    of the model), and the partial summaries are merged by summarizing them in
+    turn, until one request can hold them all.
+
+    ---
+
+    **Args**
+        - **content_from_links (str)**: The content extracted from the search results.
+        - **model (str)**: The model to be used for summarization.
+        - **max_tokens (int)**: The maximum number of tokens for the summarization.
+        - **api_key (str)**: The API key for Groq API.
+        - **objective (str)**: The objective for summarization.
+        - **reserved (bool)**: Whether the budget of one request was already reserved (by `pick`).
+
+    ---
+
+    **Returns**
+        - **distilled_info (str)**: The distilled information from the search results.
+    """
+    chunk_tokens = max(
+        256,
+        get_router(api_key).max_request_tokens(model)
+        - estimate_tokens(_distillation_prompt("", objective))
+        - MAP_SUMMARY_TOKENS,
+    )
+    chunks = split_into_chunks(content_from_links, chunk_tokens)
+    if len(chunks) == 1:
+        return distill(chunks[0], model, max_tokens, api_key, objective, reserved)
+
+    #! Map: the chunks are summarized concurrently (the first one on the reserved budget)
+    logging.info(f"Summarizing {len(chunks)} chunks of crawled content with {model}")
+    partial_summaries = list(
+        _SUMMARY_EXECUTOR.map(
+            lambda idx: distill(
+                chunks[idx],
+                model,
+                MAP_SUMMARY_TOKENS,
+                api_key,
+                objective,
+                reserved=reserved and idx == 0,
+            ),
+            range(len(chunks)),
+        )
+    )
+    partial_summaries = [summary for summary in partial_summaries if summary]
+    if not partial_summaries:
+        return """"""
+
+    #! Reduce: the partial summaries are merged (in more rounds if they still don't fit)
+    return summarize(
+        "\n".join(
+            f"<info>Partial summary {idx}\n{summary}\n</info>"
+            for idx, summary in enumerate(partial_summaries)
+        ),
+        model,
+        max_tokens,
+        api_key,
+        objective,
+    )
+
+
+def _search_query(search_query, max_results, region, deduplicator=None) -> dict:
+    """
+    ## Search the web for one query and crawl the resulting pages.
+
+    ---
+
+    **Args**
+        - **search_query (str)**: The query to search the web.
+        - **max_results (int)**: The maximum number of results to return.
+        - **region (str)**: The region to search in.
+        - **deduplicator (ParagraphDeduplicator)**: Drops the paragraphs already crawled by the other queries.
+
+    ---
+
+    **Returns**
+        - **result (dict)**: The crawled information, image links, video links and references of the query.
+    """
+    video_links = []
+    img_links = []
+    url_list = []
+    markdown_placeholder = """"""
+
+    logging.info(f"\n\nAttempting for query: {search_query}\n\n")
+    with _DDGS_SLOTS:
+        SEARCH_PACER.wait("duckduckgo")
+        ddgs = DDGS()
+        text_results = ddgs.text(search_query, region=region, max_results=max_results)
+
+        img_results = ddgs.images(
+            keywords=search_query,
+            region=region,
+            # safesearch="on",
+            size=None,
+            type_image=None,
+            layout=None,
+            license_image=None,
+            max_results=max_results,
+        )
+    SEARCH_PACER.record_success("duckduckgo")
+
+    if text_results:
+        for _, search_result in enumerate(text_results):
+
+            if "href" in search_result.keys():
+                url_list.append(search_result["href"])
+                video_links_from_search = filter_links(search_result["href"])
+
+                if not video_links_from_search:
+                    markdown_placeholder += (
+                        f"- [[**{search_result['title']}**]({search_result['href']})]\n"
+                    )
+                else:
+                    video_links.extend(video_links_from_search)
+
+    if img_results:
+        for _, image_result in enumerate(img_results):
+            video_links_from_img_search = filter_links(image_result["url"])
+            if not video_links_from_img_search:
+                markdown_placeholder += (
+                    f"- [[**{image_result['title']}**]({image_result['url']})]\n"
+                )
+            else:
+                video_links.extend(video_links_from_img_search)
+            img_links.append(image_result["image"])
+
+    content_from_links = fetch_text(
+        url_list, search_query, deduplicator=deduplicator, mode="agentic"
+    )
+    return {
+        #! All the <p> text from each link fetched from a `search_query` among the `search_queries`
+        "info": f"""<info>Information from search query: {search_query}\n"""
+        + content_from_links
+        + "\n</info>",
+        "img_links": list(set(img_links)),
+        "video_links": list(set(video_links)),
+        "markdown_placeholder": markdown_placeholder,
+    }
+
+
 def search_summary(
     search_queries,
     api_key,
     max_results=7,
     objective="summarize",
     region=REGIONS["India"],
+    deduplicator=None,
 ) -> tuple:
     """
     ## Search the web using DuckDuckGo search engine and return the results.
 
+    The queries are searched and crawled concurrently (bounded by the shared query
+    executor), and their results are combined in the order of the queries.
+
     ---
 
     **Args**
-        - **user_query (str)**: The query to search the web.
+        - **search_queries (list)**: The queries to search the web.
         - **max_results (int)**: The maximum number of results to return.
         - **region (str)**: The region to search in.
         - **api_key (str)**: The API key for Groq API.
+        - **deduplicator (ParagraphDeduplicator)**: Shared by all the queries of an agentic plan. A new one is used by default.
 
     ---
 
@@ -224,100 +500,61 @@ def search_summary(
         all_video_links = []
         all_markdown_placeholders = """"""
 
-        for search_query in search_queries:
-            try:
-                video_links = []
-                img_links = []
-                url_list = []
-                content_from_links = []
-                markdown_placeholder = """"""
-
-                logging.info(f"\n\nAttempting for query: {search_query}\n\n")
-
-                text_results = DDGS().text(
-                    search_query, region=region, max_results=max_results
-                )
-
-                img_results = DDGS().images(
-                    keywords=search_query,
-                    region=region,
-                    # safesearch="on",
-                    size=None,
-                    type_image=None,
-                    layout=None,
-                    license_image=None,
-                    max_results=max_results,
-                )
-
-                if text_results:
-                    for _, search_result in enumerate(text_results):
-
-                        if "href" in search_result.keys():
-                            url_list.append(search_result["href"])
-                            video_links_from_search = filter_links(
-                                search_result["href"]
-                            )
-
-                            if not video_links_from_search:
-                                markdown_placeholder += f"- [[**{search_result['title']}**]({search_result['href']})]\n"
-                            else:
-                                video_links.extend(video_links_from_search)
-
-                if img_results:
-                    for _, image_result in enumerate(img_results):
-                        video_links_from_img_search = filter_links(image_result["url"])
-                        if not video_links_from_img_search:
-                            markdown_placeholder += f"- [[**{image_result['title']}**]({image_result['url']})]\n"
-                        else:
-                            video_links.extend(video_links_from_img_search)
-                        img_links.append(image_result["image"])
-
-                content_from_links = fetch_text(url_list)
-                #! All the <p> text from each link fetched from a `search_query` among the `search_queries`
-                all_info += (
-                    f"""<info>Information from search query: {search_query}\n"""
-                    + content_from_links
-                    + "\n</info>"
-                )
-
-                img_links = list(set(img_links))
-                all_img_links.extend(img_links)
-                video_links = list(set(video_links))
-                all_video_links.extend(video_links)
-                all_markdown_placeholders += markdown_placeholder
-                print("\n\n Waiting for 2 seconds before next search query\n\n")
-                time.sleep(2)
+        #! Paragraphs syndicated across the pages of several queries are only sent once
+        if deduplicator is None:
+            deduplicator = ParagraphDeduplicator()
+        futures = [
+            _QUERY_EXECUTOR.submit(
+                _search_query, search_query, max_results, region, deduplicator
+            )
+            for search_query in search_queries
+        ]
 
+        succeeded = 0
+        for search_query, future in zip(search_queries, futures):
+            try:
+                result = future.result()
+            except RatelimitException as e:
+                #! Skip this query, the next ones wait for the back-off
+                delay = SEARCH_PACER.record_failure("duckduckgo")
+                logging.error(f"DuckDuckGo rate limit hit, backing off {delay}s: {e}")
+                continue
             except DuckDuckGoSearchException as e:
-                logging.error(f"Error occurred during DuckDuckGo search: {e}")
-                return None, None, None, None
+                logging.error(
+                    f"Error occurred during DuckDuckGo search for {search_query}: {e}"
+                )
+                continue
             except Exception as e:
-                logging.error(f"An unexpected error occurred: {e}")
-                return None, None, None, None
-
-        model_list = [
-            ("llama-3.1-8b-instant", 8000),
-            ("llama-3.3-70b-versatile", 32768),
-            ("openai/gpt-oss-120b", 32766),
-            ("openai/gpt-oss-20b", 32768),
-            ("meta-llama/llama-4-maverick-17b-128e-instruct", 8192),
-            ("meta-llama/llama-4-scout-17b-16e-instruct", 8192),
-            ("deepseek-r1-distill-llama-70b", 131072),
-            ("moonshotai/kimi-k2-instruct", 16384),
-            ("qwen/qwen3-32b", 40960),
-        ]
-
-        #! This is deliberately done to mitigate the rate limit errors faced for each model
-        # * We can play around with the weights to see which model works best
-        model, max_tokens = random.choices(
-            model_list, weights=[1, 1, 1, 1, 1, 1, 1, 1, 1], k=1
-        )[0]
+                logging.error(
+                    f"An unexpected error occurred for query {search_query}: {e}"
+                )
+                continue
+
+            succeeded += 1
+            all_info += result["info"]
+            all_img_links.extend(result["img_links"])
+            all_video_links.extend(result["video_links"])
+            all_markdown_placeholders += result["markdown_placeholder"]
+
+        if not succeeded:
+            logging.error("All the search queries failed.")
+            return None, None, None, None
+
+        #! Route to the model with the most rate limit headroom that fits the crawled content
+        #! and reserve its budget right away, so concurrent objectives spread across models
+        model, max_tokens = get_router(api_key).pick(
+            AGENTIC_MODELS,
+            prompt_tokens=estimate_tokens(all_info),
+            acquire=True,
+            splittable=True,  # ? `summarize` splits the content into chunks sized for the model
+        )
         distilled_info += summarize(
             content_from_links=all_info,
             model=model,
             max_tokens=max_tokens,
             api_key=api_key,
             objective=objective,
+            reserved=True,
         )
 
         return distilled_info, all_img_links, all_video_links, all_markdown_placeholders
@@ -398,25 +635,15 @@ def generate_search_strings(
         Now, based on the user's query, generate the appropriate objectives, search strings, and final objective following this JSON structure.
             """
 
-    model_list = [
-        ("llama-3.1-8b-instant", 8000),
-        ("llama-3.3-70b-versatile", 32768),
-        ("openai/gpt-oss-120b", 32766),
-        ("openai/gpt-oss-20b", 32768),
-        ("meta-llama/llama-4-maverick-17b-128e-instruct", 8192),
-        ("meta-llama/llama-4-scout-17b-16e-instruct", 8192),
-        ("deepseek-r1-distill-llama-70b", 131072),
-        ("moonshotai/kimi-k2-instruct", 16384),
-        ("qwen/qwen3-32b", 40960),
-    ]
-
-    #! This is deliberately done to mitigate the rate limit errors faced for each model
-    model, max_tokens = random.choices(
-        model_list, weights=[1, 1, 1, 1, 1, 1, 1, 1, 1], k=1
-    )[0]
+    #! Route to the model with the most rate limit headroom to mitigate rate limit errors
+    router = get_router(api_key)
+    prompt_tokens = estimate_tokens(prompt + query)
+    model, max_tokens = router.pick(
+        AGENTIC_MODELS, prompt_tokens=prompt_tokens, acquire=True
+    )
     print(f"\n\nModel selected for generating search strings: {model}\n\n")
 
-    client = Groq(api_key=api_key)
+    client = get_groq_client(api_key)
     response = client.chat.completions.create(
         model=model,
         messages=[
@@ -424,7 +651,10 @@ def generate_search_strings(
             {"role": "user", "content": query},
         ],
         temperature=1,
-        max_tokens=max_tokens,
+        # ? The response counts against the tokens per minute of the model too
+        max_tokens=max(
+            256, min(max_tokens, router.max_request_tokens(model) - prompt_tokens)
+        ),
         top_p=0.9,
         stream=False,
         response_format={"type": "json_object"},
@@ -433,13 +663,8 @@ def generate_search_strings(
     )
 
     content = response.choices[0].message.content
-    if model in ("qwen/qwen3-32b", "deepseek-r1-distill-llama-70b"):
-        parts = re.findall(r"<think>\s*([\s\S]*?)\s*</think>\s*([\s\S]*)", content)
-        if parts:
-            _, final_response = parts[0]
-            content = final_response.strip()
-        else:
-            content = content.strip()
+    if model in THINK_TAG_MODELS:
+        _, content = split_think_tags(content)
 
     try:
         json_response = json.loads(content)
@@ -477,24 +702,31 @@ def agentic_search_crawler(objective_json: dict, api_key) -> tuple:
     total_markdown_placeholders = """"""
 
     if objective_json is not None:
-        search_queries = None
+        # ? Every objective is searched and summarized as soon as its own queries finish
+        deduplicator = ParagraphDeduplicator()
+        futures = []
         for objective in objective_json["objectives"]:
-            distilled_info = """"""
-            img_links = []
-            video_links = []
-            markdown_placeholders = """"""
             search_queries = objective["search_strings"]
             if len(search_queries) > 3:
                 search_queries = search_queries[:3]  #! Limiting the search queries to 3
 
-            distilled_info, img_links, video_links, markdown_placeholders = (
-                search_summary(
+            futures.append(
+                _OBJECTIVE_EXECUTOR.submit(
+                    search_summary,
                     search_queries,
                     objective=objective_json["final_objective"],
                     api_key=api_key,
+                    deduplicator=deduplicator,
                 )
             )
 
+        for objective, future in zip(objective_json["objectives"], futures):
+            distilled_info, img_links, video_links, markdown_placeholders = (
+                future.result()
+            )
+            if distilled_info is None:
+                continue
+
             total_distilled_info += (
                 f"""<objective>{objective["description"]}</objective>\n"""
                 + distilled_info
@@ -505,6 +737,11 @@ def agentic_search_crawler(objective_json: dict, api_key) -> tuple:
             total_video_links.extend(video_links)
             total_markdown_placeholders += markdown_placeholders
 
+        logging.info(
+            f"Removed {deduplicator.stats['paragraphs_removed']} repeated paragraphs "
+            f"(~{deduplicator.stats['tokens_removed']} tokens) from the agentic search"
+        )
+
     return (
         total_distilled_info,
         total_img_links,
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+# Where the persistent caches of the app are stored
+CACHE_DIR = os.environ.get("FAST_CHAT_CACHE_DIR", ".cache")
+
+# Expired entries are purged every this many writes (or as soon as the tier is too big)
+EVICT_EVERY = 64
+
+
+class TwoTierCache:
+    """
+    A key/value cache with an in-memory LRU tier in front of a persistent SQLite tier.
+
+    Values must be JSON serializable. Entries expire after their TTL, and the SQLite
+    tier evicts the least recently used entries once it grows past `max_bytes`.
+    Eviction runs every `EVICT_EVERY` writes or when the tracked size of the tier
+    exceeds `max_bytes`, never on every write.
+
+    Attributes:
+        stats (dict): Hit and miss counters of each tier.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float = 24 * 3600,
+        max_items: int = 256,
+        max_bytes: int = 50 * 1024 * 1024,
+        path: str = None,
+    ):
+        """
+        Args:
+            name (str): The name of the cache (also the name of its SQLite table).
+            ttl (float): The default time to live of an entry in seconds.
+            max_items (int): The number of entries kept in memory.
+            max_bytes (int): The maximum size of the values kept on disk.
+            path (str, optional): The SQLite file. Defaults to `<CACHE_DIR>/fast_chat.sqlite3`.
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_bytes = 0
+        self._writes = 0
+        self._path = path or os.path.join(CACHE_DIR, "fast_chat.sqlite3")
+
+    def _connection(self):
+        """Opens the SQLite tier on first use (None if the disk is not writable)."""
+        if self._db is None:
+            try:
+                os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+                db = sqlite3.connect(self._path, check_same_thread=False, timeout=5)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(f"""CREATE TABLE IF NOT EXISTS {self.name} (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created REAL NOT NULL,
+                        expires REAL NOT NULL,
+                        accessed REAL NOT NULL
+                    )""")
+                db.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self.name}_expires ON {self.name} (expires)"
+                )
+                db.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self.name}_accessed ON {self.name} (accessed)"
+                )
+                db.commit()
+                self._disk_bytes = db.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM {self.name}"
+                ).fetchone()[0]
+                self._db = db
+            except sqlite3.Error as e:
+                logging.error(f"Disk cache {self.name} unavailable: {e}")
+                self._db = False
+        return self._db or None
+
+    def _remember(self, key: str, entry: tuple) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get_entry(self, key: str):
+        """
+        Returns the cached value of the key along with its age.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            tuple: (value, age in seconds), or None on a miss or an expired entry.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[2] > now:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[0], now - entry[1]
+
+            db = self._connection()
+            row = None
+            if db is not None:
+                try:
+                    row = db.execute(
+                        f"SELECT value, created, expires FROM {self.name} WHERE key = ?",
+                        (key,),
+                    ).fetchone()
+                    if row is not None and row[2] > now:
+                        db.execute(
+                            f"UPDATE {self.name} SET accessed = ? WHERE key = ?",
+                            (now, key),
+                        )
+                        db.commit()
+                except sqlite3.Error as e:
+                    logging.error(f"Disk cache {self.name} read failed: {e}")
+                    row = None
+
+            if row is None or row[2] <= now:
+                self._memory.pop(key, None)
+                self.stats["misses"] += 1
+                return None
+
+            value = json.loads(row[0])
+            self._remember(key, (value, row[1], row[2]))
+            self.stats["disk_hits"] += 1
+            return value, now - row[1]
+
+    def get(self, key: str):
+        """Returns the cached value of the key, or None."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value, ttl: float = None) -> None:
+        """
+        Stores the value in both tiers.
+
+        Args:
+            key (str): The cache key.
+            value: The JSON serializable value.
+            ttl (float, optional): Overrides the default time to live.
+        """
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        serialized = json.dumps(value)
+        with self._lock:
+            self._remember(key, (value, now, expires))
+            db = self._connection()
+            if db is None:
+                return
+            try:
+                replaced = db.execute(
+                    f"SELECT size FROM {self.name} WHERE key = ?", (key,)
+                ).fetchone()
+                db.execute(
+                    f"INSERT OR REPLACE INTO {self.name} VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, serialized, len(serialized), now, expires, now),
+                )
+                db.commit()
+                self._disk_bytes += len(serialized) - (replaced[0] if replaced else 0)
+                self._writes += 1
+                if self._writes % EVICT_EVERY == 0 or self._disk_bytes > self.max_bytes:
+                    self._evict(db, now)
+            except sqlite3.Error as e:
+                logging.error(f"Disk cache {self.name} write failed: {e}")
+
+    def _evict(self, db, now: float) -> None:
+        """Drops expired entries, then the least recently used ones beyond `max_bytes`."""
+        expired = db.execute(f"DELETE FROM {self.name} WHERE expires <= ?", (now,))
+        self.stats["evictions"] += expired.rowcount
+        total = db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.name}").fetchone()
+        self._disk_bytes = total[0]
+        excess = total[0] - self.max_bytes
+        if excess > 0:
+            victims = []
+            for key, size in db.execute(
+                f"SELECT key, size FROM {self.name} ORDER BY accessed"
+            ):
+                victims.append((key,))
+                excess -= size
+                self._disk_bytes -= size
+                if excess <= 0:
+                    break
+            db.executemany(f"DELETE FROM {self.name} WHERE key = ?", victims)
+            self.stats["evictions"] += len(victims)
+            for (key,) in victims:
+                self._memory.pop(key, None)
+        db.commit()
+
+    def hit_rate(self) -> float:
+        """The share of lookups served from either tier."""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.context_window import message_tokens
+from utils.groq_client import get_groq_client
+from utils.rate_limits import get_router
+from utils.tokens import estimate_tokens
+
+COMPACTION_MODEL = "llama-3.1-8b-instant"
+# History size (in tokens) above which older turns are compacted
+COMPACTION_THRESHOLD_TOKENS = 4000
+# Messages folded into the memory at a time
+COMPACTION_BLOCK = 6
+# Latest messages always sent verbatim
+KEEP_RECENT_MESSAGES = 4
+# Search results and transcripts are clipped when compacted
+MAX_CHARS_PER_MESSAGE = 4000
+# Summaries remembered across all the sessions of the process (least recently used dropped first)
+MAX_SUMMARIES = 256
+
+# Summaries are computed once per (epoch, message range) and shared across reruns
+_SUMMARIES = OrderedDict()
+_LOCK = threading.RLock()
+_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="compaction")
+
+
+def _range_key(epoch: int, messages: list) -> str:
+    digest = hashlib.sha256(str(epoch).encode())
+    for message in messages:
+        digest.update(message["role"].encode())
+        digest.update(str(message["content"]).encode())
+    return digest.hexdigest()
+
+
+def _get_summary(key: str):
+    """Returns the summary future of the range key (None if unknown), marking it as recently used."""
+    with _LOCK:
+        future = _SUMMARIES.get(key)
+        if future is not None:
+            _SUMMARIES.move_to_end(key)
+        return future
+
+
+def _summarize(api_key: str, previous, messages: list) -> str:
+    """
+    Folds a block of messages into the memory built from the previous blocks.
+
+    Args:
+        api_key (str): The API key for Groq API.
+        previous (Future, optional): The memory of the messages before this block.
+        messages (list): The block of messages to fold in.
+
+    Returns:
+        str: The updated memory.
+    """
+    memory = previous.result() if previous is not None else ""
+    transcript = "\n".join(
+        f"{message['role']}: {str(message['content'])[:MAX_CHARS_PER_MESSAGE]}"
+        for message in messages
+    )
+    prompt = f"""
+    Update the memory of a conversation between a user and an AI assistant.
+
+    #Instructions:
+    - Keep the facts, decisions, names, numbers and open questions needed to continue the conversation.
+    - Drop greetings, repetition and raw search results that were not used.
+    - Write at most 300 words in concise bullet points.
+
+    #Current memory:
+    {memory or "(empty)"}
+
+    #New messages:
+    {transcript}
+
+    Respond only with the updated memory.
+    """
+
+    get_router(api_key).acquire(COMPACTION_MODEL, estimate_tokens(prompt))
+    response = get_groq_client(api_key).chat.completions.create(
+        model=COMPACTION_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.3,
+        max_tokens=1024,
+        stream=False,
+    )
+    return response.choices[0].message.content
+
+
+def _summary_future(api_key: str, epoch: int, history: list, end: int):
+    """
+    Returns the (possibly still running) summary of `history[:end]`, scheduling it if needed.
+
+    Each block is summarized on top of the summary of the blocks before it, so a
+    range that was already compacted is never summarized again.
+    """
+    key = _range_key(epoch, history[:end])
+    with _LOCK:
+        future = _get_summary(key)
+        if future is not None and not (future.done() and future.exception()):
+            return future
+
+        previous = None
+        if end > COMPACTION_BLOCK:
+            previous = _summary_future(api_key, epoch, history, end - COMPACTION_BLOCK)
+        future = _EXECUTOR.submit(
+            _summarize, api_key, previous, history[end - COMPACTION_BLOCK : end]
+        )
+        _SUMMARIES[key] = future
+        while len(_SUMMARIES) > MAX_SUMMARIES:
+            _SUMMARIES.popitem(last=False)
+        logging.info(f"Scheduled compaction of messages 1-{end} (epoch {epoch})")
+        return future
+
+
+def compact_history(
+    messages: list,
+    api_key: str,
+    epoch: int,
+    turn_start: int,
+    threshold_tokens: int = COMPACTION_THRESHOLD_TOKENS,
+) -> tuple:
+    """
+    Replaces the older turns of a long conversation with a compact memory block.
+
+    Once the history before the current turn passes `threshold_tokens`, its older
+    messages are summarized in the background with a cheap model. The latest
+    memory that is ready is merged into the system message and replaces the
+    messages it covers; until then the history is returned unchanged.
+
+    Args:
+        messages (list): The full chat history of the current epoch.
+        api_key (str): The API key for Groq API.
+        epoch (int): The context epoch (bumped on every "Clear Chat").
+        turn_start (int): Index of the first message of the current turn.
+        threshold_tokens (int): The history size above which compaction starts.
+
+    Returns
+        - messages (list): The messages with the older turns compacted.
+        - turn_start (int): Index of the first message of the current turn in the new list.
+    """
+    head = messages[:1] if messages and messages[0]["role"] == "system" else []
+    history = messages[len(head) : turn_start]
+    if sum(message_tokens(message) for message in history) <= threshold_tokens:
+        return messages, turn_start
+
+    end = (len(history) - KEEP_RECENT_MESSAGES) // COMPACTION_BLOCK * COMPACTION_BLOCK
+    if end <= 0:
+        return messages, turn_start
+    _summary_future(api_key, epoch, history, end)
+
+    # ? Use the most recent memory that is already available
+    memory = None
+    while end > 0 and memory is None:
+        future = _get_summary(_range_key(epoch, history[:end]))
+        if future is not None and future.done() and not future.exception():
+            memory = future.result()
+        else:
+            end -= COMPACTION_BLOCK
+    if memory is None:
+        return messages, turn_start
+
+    system_content = head[0]["content"] if head else ""
+    memory_message = {
+        "role": "system",
+        "content": system_content
+        + f"\n<memory>Summary of the earlier conversation:\n{memory}\n</memory>",
+    }
+    compacted = [memory_message] + history[end:] + messages[turn_start:]
+    logging.info(f"Compacted {end} older messages into the memory block")
+    return compacted, 1 + len(history) - end
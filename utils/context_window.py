@@ -0,0 +1,152 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from utils.tokens import context_window, estimate_tokens
+
+# Overhead of the role and separators added by the chat template to every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Token counts remembered across the sessions of the process
+MAX_CACHED_COUNTS = 4096
+
+# Keyed on (hash, length) of the content, so the message bodies themselves aren't kept alive
+_COUNTS = OrderedDict()
+_COUNTS_LOCK = threading.Lock()
+
+
+def message_tokens(message: dict) -> int:
+    """
+    Returns the estimated number of tokens of a chat message.
+
+    Counts are cached per content, so messages resent on every turn are only
+    estimated once. The cache holds the hash and length of each content rather
+    than the content (the hash of a `str` is itself cached by Python).
+
+    Args:
+        message (dict): The chat message.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    content = message.get("content")
+    if not isinstance(content, str):
+        content = str(content)
+    key = (hash(content), len(content))
+    with _COUNTS_LOCK:
+        count = _COUNTS.get(key)
+        if count is not None:
+            _COUNTS.move_to_end(key)
+            return count
+
+    count = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    with _COUNTS_LOCK:
+        _COUNTS[key] = count
+        while len(_COUNTS) > MAX_CACHED_COUNTS:
+            _COUNTS.popitem(last=False)
+    return count
+
+
+def prompt_budget(model: str, max_tokens: int = None, budget: int = None) -> int:
+    """
+    Returns the number of tokens the outgoing messages may take for the model.
+
+    Args:
+        model (str): The model the messages are sent to.
+        max_tokens (int, optional): The tokens requested for the response.
+        budget (int, optional): A user configured cap on the prompt size.
+
+    Returns:
+        int: The prompt budget in tokens.
+    """
+    window = context_window(model)
+    # ? Keep room for the response, but never let it take more than half the window
+    available = window - min(max_tokens or 0, window // 2)
+    return min(available, budget) if budget else available
+
+
+def build_context(
+    messages: list,
+    model: str,
+    max_tokens: int = None,
+    budget: int = None,
+    turn_start: int = None,
+) -> list:
+    """
+    Assembles the messages to send to the model within its token budget.
+
+    The leading system message and the messages of the current turn are always
+    kept. Older messages are then added from the newest to the oldest until the
+    budget is spent, so long sessions stop growing in size and in latency.
+
+    Args:
+        messages (list): The full chat history of the current epoch.
+        model (str): The model the messages are sent to.
+        max_tokens (int, optional): The tokens requested for the response.
+        budget (int, optional): A user configured cap on the prompt size.
+        turn_start (int, optional): Index of the first message of the current turn
+            (the user prompt followed by any transcript or search results). Defaults
+            to the last message.
+
+    Returns:
+        list: The messages to send, in their original order.
+    """
+    if not messages:
+        return []
+
+    limit = prompt_budget(model, max_tokens, budget)
+    if turn_start is None or turn_start >= len(messages):
+        turn_start = len(messages) - 1
+    pinned = set(range(turn_start, len(messages)))
+    if messages[0].get("role") == "system":
+        pinned.add(0)
+
+    used = sum(message_tokens(messages[idx]) for idx in pinned)
+    kept = set(pinned)
+    for idx in range(len(messages) - 1, -1, -1):
+        if idx in kept:
+            continue
+        tokens = message_tokens(messages[idx])
+        if used + tokens > limit:
+            break
+        kept.add(idx)
+        used += tokens
+
+    if len(kept) < len(messages):
+        logging.info(
+            f"Context trimmed to {len(kept)}/{len(messages)} messages "
+            f"({used} tokens, budget {limit}) for {model}"
+        )
+    return [message for idx, message in enumerate(messages) if idx in kept]
+
+
+def remaining_budget(
+    messages: list,
+    model: str,
+    max_tokens: int = None,
+    budget: int = None,
+    turn_start: int = None,
+) -> int:
+    """
+    Returns the tokens left for another message of the current turn, such as search results.
+
+    Only the messages `build_context` always keeps (the leading system message and
+    the current turn) are counted, so older history gives way to the new message.
+
+    Args:
+        messages (list): The full chat history of the current epoch.
+        model (str): The model the messages are sent to.
+        max_tokens (int, optional): The tokens requested for the response.
+        budget (int, optional): A user configured cap on the prompt size.
+        turn_start (int, optional): Index of the first message of the current turn.
+
+    Returns:
+        int: The tokens the content of the new message may take (at least 0).
+    """
+    limit = prompt_budget(model, max_tokens, budget)
+    if turn_start is None or turn_start >= len(messages):
+        turn_start = len(messages) - 1
+    pinned = set(range(max(turn_start, 0), len(messages)))
+    if messages and messages[0].get("role") == "system":
+        pinned.add(0)
+    used = sum(message_tokens(messages[idx]) for idx in pinned)
+    return max(0, limit - used - MESSAGE_OVERHEAD_TOKENS)
@@ -0,0 +1,179 @@
+import re
+import zlib
+import logging
+import threading
+
+import numpy as np
+
+from utils.tokens import estimate_tokens
+
+# Estimated Jaccard similarity (of word 3-grams) above which a paragraph is a repeat
+DEFAULT_SIMILARITY_THRESHOLD = 0.6
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 3
+
+# A prime above 2**32, so the permutations of 32 bit shingle hashes stay below 2**64
+_PRIME = np.uint64(4294967311)
+_RNG = np.random.default_rng(0x5EED)
+# ? Fixed seed: signatures must be comparable across every deduplicator of the process
+_A = _RNG.integers(1, 2**32 - 1, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _RNG.integers(0, 2**32 - 1, NUM_PERMUTATIONS, dtype=np.uint64)
+
+_WORD = re.compile(r"\w+")
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """
+    Returns the MinHash signature of the word 3-grams of the text.
+
+    Args:
+        text (str): The paragraph.
+
+    Returns:
+        np.ndarray: `NUM_PERMUTATIONS` unsigned integers. The share of positions two
+        signatures agree on estimates the Jaccard similarity of the paragraphs.
+    """
+    words = _WORD.findall(text.lower())
+    shingles = {
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(max(1, len(words) - SHINGLE_SIZE + 1))
+    }
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode()) for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+class ParagraphDeduplicator:
+    """
+    Drops paragraphs that repeat (near verbatim) paragraphs already sent to the model.
+
+    One deduplicator covers the pages of a search, or every search of an agentic
+    plan. Only the paragraphs passed to `remember` (or selected by `claim`) count
+    as sent, so a paragraph that a ranking stage later drops doesn't hide its
+    copies from other searches.
+
+    Attributes:
+        stats (dict): The paragraphs and estimated tokens removed so far.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_SIMILARITY_THRESHOLD):
+        """
+        Args:
+            threshold (float): The estimated Jaccard similarity above which a paragraph is dropped.
+        """
+        self.threshold = threshold
+        self.stats = {"paragraphs_removed": 0, "tokens_removed": 0}
+
+        self._signatures = np.empty((0, NUM_PERMUTATIONS), dtype=np.uint64)
+        self._lock = threading.Lock()
+
+    def _is_repeat(self, signature: np.ndarray, others: np.ndarray) -> bool:
+        if not len(others):
+            return False
+        return (others == signature).mean(axis=1).max() >= self.threshold
+
+    def _signatures_of(self, page_paragraphs: list) -> tuple:
+        """Returns the paragraphs of all the pages and their signatures (computed unlocked)."""
+        paragraphs = [p for page in page_paragraphs for p in page or []]
+        if not paragraphs:
+            return paragraphs, None
+        return paragraphs, np.vstack([minhash_signature(p) for p in paragraphs])
+
+    def _filter(self, page_paragraphs: list, paragraphs: list, signatures) -> tuple:
+        """
+        Returns the pages without the repeats of remembered or earlier paragraphs,
+        and the signature of every kept paragraph. Called with the lock held.
+        """
+        if not paragraphs:
+            return [list(page or []) for page in page_paragraphs], {}
+
+        remembered = self._signatures
+        keep = np.ones(len(paragraphs), dtype=bool)
+        for index, signature in enumerate(signatures):
+            earlier = signatures[:index][keep[:index]]
+            if self._is_repeat(signature, remembered) or self._is_repeat(
+                signature, earlier
+            ):
+                keep[index] = False
+
+        unique_pages, index = [], 0
+        for page in page_paragraphs:
+            count = len(page or [])
+            unique_pages.append(
+                [p for p, kept in zip(page or [], keep[index : index + count]) if kept]
+            )
+            index += count
+
+        removed = int((~keep).sum())
+        tokens_removed = sum(
+            estimate_tokens(p) for p, kept in zip(paragraphs, keep) if not kept
+        )
+        self.stats["paragraphs_removed"] += removed
+        self.stats["tokens_removed"] += tokens_removed
+        if removed:
+            logging.info(
+                f"Removed {removed} repeated paragraphs (~{tokens_removed} tokens)"
+            )
+        kept_signatures = {
+            p: signature
+            for p, signature, kept in zip(paragraphs, signatures, keep)
+            if kept
+        }
+        return unique_pages, kept_signatures
+
+    def unique(self, page_paragraphs: list) -> list:
+        """
+        Removes the paragraphs that repeat a remembered one or an earlier one of the batch.
+
+        Args:
+            page_paragraphs (list): The paragraphs of each page (None for pages without any).
+
+        Returns:
+            list: The paragraphs of each page without the repeats.
+        """
+        paragraphs, signatures = self._signatures_of(page_paragraphs)
+        with self._lock:
+            return self._filter(page_paragraphs, paragraphs, signatures)[0]
+
+    def claim(self, page_paragraphs: list, select=None) -> list:
+        """
+        Removes the repeats, selects among the rest and remembers the selection, atomically.
+
+        Concurrent searches sharing the deduplicator each see the paragraphs the
+        others claimed, which `unique` followed by `remember` can't guarantee.
+
+        Args:
+            page_paragraphs (list): The paragraphs of each page (None for pages without any).
+            select (callable, optional): Takes the unique paragraphs of each page and
+                returns the ones sent to the model (all of them by default).
+
+        Returns:
+            list: The selected paragraphs of each page.
+        """
+        paragraphs, signatures = self._signatures_of(page_paragraphs)
+        with self._lock:
+            unique_pages, kept = self._filter(page_paragraphs, paragraphs, signatures)
+            selected = select(unique_pages) if select is not None else unique_pages
+            claimed = [p for page in selected for p in page or []]
+            if claimed:
+                self._signatures = np.vstack(
+                    [self._signatures]
+                    + [kept[p] if p in kept else minhash_signature(p) for p in claimed]
+                )
+        return selected
+
+    def remember(self, paragraphs: list) -> None:
+        """
+        Marks paragraphs as sent, so their copies are dropped from later batches.
+
+        Args:
+            paragraphs (list): The paragraphs sent to the model.
+        """
+        if not paragraphs:
+            return
+        signatures = np.vstack([minhash_signature(p) for p in paragraphs])
+        with self._lock:
+            self._signatures = np.vstack([self._signatures, signatures])
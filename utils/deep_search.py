@@ -1,12 +1,253 @@
 import asyncio
 import aiohttp
 import re
-import random
-from bs4 import BeautifulSoup
-import chardet  # For detecting the encoding of the HTML content
+import codecs
+import atexit
+import threading
+import time
+import chardet  # For detecting the encoding of pages that don't declare it
 
+from utils.page_cache import get_cached_page, cache_page
+from utils.html_extractors import extract_paragraphs
+from utils.paragraph_ranking import (
+    rank_paragraphs,
+    sort_by_relevance,
+    DEFAULT_TOKEN_BUDGET,
+)
+from utils.dedup import ParagraphDeduplicator
+from utils.domain_health import DOMAIN_HEALTH
 
-async def fetch_html(session, url, timeout):
+# Returned by `fetch_html` when the cached copy of the page is still valid
+NOT_MODIFIED = object()
+# Returned by `fetch_html` for failures worth retrying (connection errors, 429 and 5xx)
+TRANSIENT_FAILURE = object()
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# A transient failure faster than this is retried once, after a short pause
+FAST_FAILURE_SECONDS = 1.0
+RETRY_DELAY = 0.2
+# Seconds a page may take before its request times out
+PAGE_TIMEOUT = 5
+
+# (soft deadline in seconds, pages with paragraphs after which to stop waiting)
+# of the deep search of each search mode; the rest of the pages are cancelled
+SEARCH_MODE_DEADLINES = {
+    "serp": (2.5, 6),
+    "agentic": (3.0, 5),
+}
+
+# Content types worth parsing (pages served without a content type are parsed too)
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+# Pages are never downloaded beyond this size
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# The download stops once this many substantial paragraphs have been received
+ENOUGH_PARAGRAPHS = 30
+
+try:
+    import brotli  # noqa: F401 (lets aiohttp decode brotli responses)
+
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+# Bytes sniffed for a <meta charset> declaration, and fed to chardet as a last resort
+SNIFF_BYTES = 4096
+DETECT_BYTES = 16 * 1024
+
+_META_CHARSET = re.compile(
+    rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-z0-9_.:-]+)""", re.IGNORECASE
+)
+_RAW_PARAGRAPH = re.compile(rb"<p[\s>](.*?)</p>", re.IGNORECASE | re.DOTALL)
+_RAW_TAG = re.compile(rb"<[^>]*>")
+
+
+class PageFetcher:
+    """
+    Runs the page downloads on a dedicated background event loop with one long-lived session.
+
+    Keeping the loop and the `aiohttp.ClientSession` alive across `fetch_text` calls
+    lets the connection pool, the DNS cache and the TLS sessions be reused instead
+    of being rebuilt for every search query. Synchronous callers submit coroutines
+    with `run`.
+    """
+
+    def __init__(
+        self,
+        limit=64,
+        limit_per_host=8,
+        dns_cache_ttl=300,
+        keepalive_timeout=30,
+    ):
+        """
+        Args:
+            limit (int): The maximum number of connections open at once.
+            limit_per_host (int): The maximum number of connections open to the same host.
+            dns_cache_ttl (int): Seconds to cache the resolved addresses of a host.
+            keepalive_timeout (int): Seconds to keep an idle connection open.
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+
+        self._loop = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="page-fetcher", daemon=True
+                ).start()
+                atexit.register(self.close)
+            return self._loop
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Returns the shared session (must be awaited on the fetcher loop)."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def run(self, coro, timeout=None):
+        """
+        Runs the coroutine on the fetcher loop and waits for its result.
+
+        Args:
+            coro (coroutine): The coroutine to run.
+            timeout (float, optional): Seconds to wait for the result.
+
+        Returns:
+            The result of the coroutine.
+        """
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+    def close(self):
+        """Closes the shared session (called at exit)."""
+        if self._session is not None and not self._session.closed:
+            self.run(self._session.close(), timeout=5)
+
+
+# Shared by every deep search of the app process
+PAGE_FETCHER = PageFetcher()
+
+
+def count_paragraphs(raw_html: bytes, start: int = 0) -> tuple:
+    """
+    Cheaply counts the substantial (more than 10 words) <p> tags of partially downloaded HTML.
+
+    Parameters:
+        raw_html (bytes): The HTML received so far.
+        start (int): The offset to resume scanning from.
+
+    Returns:
+        tuple: The number of substantial paragraphs found after `start` and the
+        offset to resume the next scan from.
+    """
+    count = 0
+    for match in _RAW_PARAGRAPH.finditer(raw_html, start):
+        if len(_RAW_TAG.sub(b" ", match.group(1)).split()) > 10:
+            count += 1
+        start = match.end()
+    return count, start
+
+
+def _known_encoding(name) -> str:
+    """Returns the Python codec name of a declared charset, or None if it is unknown."""
+    if isinstance(name, bytes):
+        name = name.decode("ascii", errors="ignore")
+    if not name:
+        return None
+    try:
+        encoding = codecs.lookup(name.strip().strip("\"'")).name
+    except LookupError:
+        return None
+    # ? Browsers decode latin-1 declarations as windows-1252, and so do the pages
+    return "cp1252" if encoding in ("latin-1", "iso8859-1", "ascii") else encoding
+
+
+def resolve_encoding(raw_content: bytes, header_charset: str = None) -> str:
+    """
+    Resolves the encoding of a page without running chardet over the whole of it.
+
+    A byte order mark wins, then the charset of the `Content-Type` header, then a
+    `<meta charset>` in the first few KB. Undeclared pages that are valid UTF-8
+    (most of the web) are detected by a C speed strict decode, and chardet only
+    looks at a small prefix of the remaining ones.
+
+    Parameters:
+        raw_content (bytes): The (possibly truncated) body of the page.
+        header_charset (str, optional): The charset of the `Content-Type` header.
+
+    Returns:
+        str: The encoding to decode the page with.
+    """
+    # ? A byte order mark beats any declaration (WHATWG encoding sniffing order)
+    if raw_content.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if raw_content.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+
+    encoding = _known_encoding(header_charset)
+    if encoding:
+        return encoding
+
+    match = _META_CHARSET.search(raw_content, 0, SNIFF_BYTES)
+    encoding = _known_encoding(match.group(1)) if match else None
+    if encoding:
+        return encoding
+
+    try:
+        raw_content.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        if e.start >= len(raw_content) - 3:
+            return "utf-8"  # ? Only a character cut off by the size cap is invalid
+
+    return chardet.detect(raw_content[:DETECT_BYTES])["encoding"] or "utf-8"
+
+
+def decode_page(raw_content: bytes, header_charset: str = None) -> str:
+    """Decodes the body of a page with the encoding picked by `resolve_encoding`."""
+    return raw_content.decode(
+        resolve_encoding(raw_content, header_charset), errors="ignore"
+    )
+
+
+async def read_page(response, max_bytes=MAX_PAGE_BYTES, enough=ENOUGH_PARAGRAPHS):
+    """
+    Streams the body of a page, stopping at `max_bytes` or once `enough` paragraphs arrived.
+
+    Parameters:
+        response (aiohttp.ClientResponse): The response to read.
+        max_bytes (int): The maximum number of (decompressed) bytes to read.
+        enough (int): The number of substantial paragraphs after which to stop.
+
+    Returns:
+        bytes: The (possibly truncated) body.
+    """
+    raw_content = bytearray()
+    paragraphs, scanned = 0, 0
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        raw_content += chunk
+        found, scanned = count_paragraphs(raw_content, scanned)
+        paragraphs += found
+        if paragraphs >= enough or len(raw_content) >= max_bytes:
+            response.close()  # ? Don't download the rest of the page
+            break
+    return bytes(raw_content[:max_bytes])
+
+
+async def fetch_html(session, url, timeout, validators=None):
     """
     Asynchronously fetches the HTML content of the given URL within a specified timeout.
 
@@ -14,113 +255,377 @@ async def fetch_html(session, url, timeout):
         session (aiohttp.ClientSession): The client session to use for the request.
         url (str): The URL to fetch.
         timeout (aiohttp.ClientTimeout): The timeout setting for the request.
+        validators (dict, optional): The `ETag`/`Last-Modified` headers of a cached
+            copy, sent as a conditional request.
 
     Returns:
-        str: The HTML content of the page if the request is successful, None otherwise.
+        tuple: The HTML content of the page (`NOT_MODIFIED` if the cached copy is
+        still valid, empty if the page is not HTML, `TRANSIENT_FAILURE` if the
+        request may succeed when retried, None if it failed) and the validators
+        of the response.
     """
+    headers = {
+        "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.1",
+        "Accept-Encoding": ACCEPT_ENCODING,
+    }
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    started_at = time.monotonic()
     try:
-        async with session.get(url, timeout=timeout) as response:
+        async with session.get(url, timeout=timeout, headers=headers) as response:
+            if response.status == 304:
+                return NOT_MODIFIED, validators
             if response.status == 200:
-                raw_content = await response.read()
-                detected_encoding = chardet.detect(raw_content)["encoding"]
-                return raw_content.decode(detected_encoding, errors="ignore")
+                content_type = response.headers.get("Content-Type", "").lower()
+                if content_type and not content_type.startswith(HTML_CONTENT_TYPES):
+                    print(f"Skipping {url}: {content_type}")
+                    return "", None  # ? Cached as a page without paragraphs
+
+                raw_content = await read_page(response)
+                response_validators = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+                # ? chardet may have to run, which would stall every other download
+                html = await asyncio.to_thread(
+                    decode_page, raw_content, response.charset
+                )
+                return html, response_validators
             else:
                 print(f"Failed to fetch {url}: HTTP {response.status}")
-                return None
+                await asyncio.to_thread(
+                    DOMAIN_HEALTH.record,
+                    url,
+                    False,
+                    time.monotonic() - started_at,
+                    reason=f"HTTP {response.status}",
+                )
+                if response.status in RETRYABLE_STATUSES:
+                    return TRANSIENT_FAILURE, None
+                return None, None
     except asyncio.TimeoutError:
         print(f"Timeout error for {url}")
-        return None
+        await asyncio.to_thread(
+            DOMAIN_HEALTH.record,
+            url,
+            False,
+            time.monotonic() - started_at,
+            reason="timeout",
+        )
+        return None, None
     except aiohttp.ClientError as e:
         print(f"Client error for {url}: {e}")
-        return None
+        await asyncio.to_thread(
+            DOMAIN_HEALTH.record,
+            url,
+            False,
+            time.monotonic() - started_at,
+            reason=type(e).__name__,
+        )
+        return TRANSIENT_FAILURE, None
+
+
+async def fetch_paragraphs(session, url, timeout):
+    """
+    Returns all the paragraphs of a page, from the page cache whenever possible.
+
+    A fresh cached page skips both the network and the HTML parsing. A stale one
+    is revalidated with a conditional request, and is still used if the server
+    can't be reached. A transient failure that comes back quickly is retried once.
+    The page cache, the domain health records and the HTML parsing run in worker
+    threads, so the shared fetch loop only ever waits on the network.
+
+    Parameters:
+        session (aiohttp.ClientSession): The client session to use for the request.
+        url (str): The URL to fetch.
+        timeout (aiohttp.ClientTimeout): The timeout setting for the request.
+
+    Returns:
+        list of str: The cleaned paragraphs of the page, or None if it couldn't be fetched.
+    """
+    cached = await asyncio.to_thread(get_cached_page, url)
+    if cached is not None:
+        paragraphs, validators, fresh = cached
+        if fresh:
+            return paragraphs
+    else:
+        paragraphs, validators = None, None
+
+    started_at = time.monotonic()
+    html, response_validators = await fetch_html(session, url, timeout, validators)
+    if (
+        html is TRANSIENT_FAILURE
+        and time.monotonic() - started_at < FAST_FAILURE_SECONDS
+    ):
+        # ? A host that fails fast (reset connection, 503) usually answers the retry
+        await asyncio.sleep(RETRY_DELAY)
+        started_at = time.monotonic()
+        html, response_validators = await fetch_html(session, url, timeout, validators)
+    if html is TRANSIENT_FAILURE:
+        html = None
+    if html is NOT_MODIFIED:
+        latency = time.monotonic() - started_at
+        # ? Fresh again
+        await asyncio.to_thread(_store_page, url, paragraphs, validators, latency)
+        return paragraphs
+    if html is None:
+        return paragraphs  # ? The failure was recorded by `fetch_html`
 
+    latency = time.monotonic() - started_at
+    paragraphs = await asyncio.to_thread(extract_all_paragraphs, html)
+    await asyncio.to_thread(_store_page, url, paragraphs, response_validators, latency)
+    return paragraphs
+
+
+def _store_page(url, paragraphs, validators, latency):
+    """Caches the paragraphs of a fetched page and records the fetch as a success."""
+    cache_page(url, paragraphs, validators)
+    DOMAIN_HEALTH.record(url, True, latency, len(paragraphs or []))
 
-async def fetch_all_html(urls):
+
+def _record_deadline_misses(urls):
+    """Records the pages still loading at the soft deadline as slow (not failed) fetches."""
+    for url in urls:
+        # ? The page would have taken anywhere up to the request timeout
+        DOMAIN_HEALTH.record_slow(url, PAGE_TIMEOUT)
+
+
+async def fetch_all_paragraphs(urls, soft_deadline=None, enough_pages=None):
     """
-    Asynchronously fetches the HTML content for a list of URLs.
+    Asynchronously fetches the paragraphs for a list of URLs.
+
+    Without a soft deadline every page is waited for (up to its 5s timeout). With
+    one, the pages still loading are cancelled once the deadline passes or once
+    `enough_pages` pages with paragraphs have arrived, so one slow host doesn't
+    hold up a search whose other pages came back in a few hundred milliseconds.
 
     Parameters:
         urls (list of str): The list of URLs to fetch.
+        soft_deadline (float, optional): Seconds after which to stop waiting for pages.
+        enough_pages (int, optional): Pages with paragraphs after which to stop waiting.
 
     Returns:
-        list of str: The list of HTML contents for each URL.
+        list of list of str: The paragraphs of each URL (None for the failed or cancelled ones).
     """
     timeout = aiohttp.ClientTimeout(
-        total=5
+        total=PAGE_TIMEOUT
     )  # Set the total timeout for each request to 5 seconds
-    async with aiohttp.ClientSession() as session:
-        tasks = [fetch_html(session, url, timeout) for url in urls]
-        return await asyncio.gather(*tasks)
+    session = await PAGE_FETCHER.session()
+    tasks = [
+        asyncio.ensure_future(fetch_paragraphs(session, url, timeout)) for url in urls
+    ]
+    results = [None] * len(tasks)
+    positions = {task: position for position, task in enumerate(tasks)}
+
+    loop = asyncio.get_running_loop()
+    stop_at = None if soft_deadline is None else loop.time() + soft_deadline
+    pending, good_pages = set(tasks), 0
+    while pending:
+        done, pending = await asyncio.wait(
+            pending,
+            timeout=None if stop_at is None else max(0.0, stop_at - loop.time()),
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        for task in done:
+            try:
+                results[positions[task]] = task.result()
+            except Exception as e:
+                print(f"Error fetching {urls[positions[task]]}: {e}")
+                continue
+            if results[positions[task]]:
+                good_pages += 1
+        if not done or (enough_pages and good_pages >= enough_pages):
+            break
+
+    if pending:
+        print(
+            f"Stopped waiting for {len(pending)} slow pages "
+            f"({good_pages} pages with paragraphs arrived)"
+        )
+        for task in pending:
+            task.cancel()
+        if not done:  # ? Only the hosts that missed the deadline are to blame
+            late_urls = [urls[positions[task]] for task in pending]
+            await asyncio.to_thread(_record_deadline_misses, late_urls)
+        await asyncio.gather(*pending, return_exceptions=True)
+    return results
 
 
-def extract_paragraph_texts(html):
+def extract_all_paragraphs(html, backend=None):
     """
-    Extracts the text content of all <p> tags from the given HTML.
+    Extracts the cleaned text content of all the substantial <p> tags from the given HTML.
 
     Parameters:
         html (str): The HTML content to parse.
+        backend (str, optional): The parser to use (see `utils.html_extractors.EXTRACTORS`).
+            Defaults to the fastest one installed.
 
     Returns:
-        list of str: The list of text contents from all <p> tags.
-    """
-    soup = BeautifulSoup(html, "html.parser")
-    paragraphs = []
-    for p in soup.find_all("p"):
-        text = p.get_text().strip()
-        basic_cleaned_text = re.sub(
-            "^\s+?", "", re.sub("\n", "", re.sub(r"\s+", " ", text))
-        )
-        if len(basic_cleaned_text.split()) > 10:
-            paragraphs.append(basic_cleaned_text)
+        list of str: The text contents of the <p> tags with more than 10 words.
+    """
+    return extract_paragraphs(html, backend)
 
-    # If there are many paragraphs, we randomly select 5 paragraphs
-    if len(paragraphs) > 5:
-        paragraphs = [random.choice(paragraphs) for _ in range(5)]
-        return paragraphs
-    return paragraphs
+
+def select_paragraphs(paragraphs, query=None):
+    """
+    Picks the paragraphs of a page to send to the model.
+
+    Parameters:
+        paragraphs (list of str): All the paragraphs of the page.
+        query (str, optional): The user query the paragraphs are ranked against.
+            Without one, the leading paragraphs of the page are kept.
+
+    Returns:
+        list of str: At most 5 of the paragraphs, in the order of the page.
+    """
+    return rank_paragraphs(query or "", [paragraphs], token_budget=None)[0]
 
 
-async def main(urls):
+def extract_paragraph_texts(html, query=None):
+    """
+    Extracts the text content of the most relevant <p> tags from the given HTML.
+
+    Parameters:
+        html (str): The HTML content to parse.
+        query (str, optional): The user query the paragraphs are ranked against.
+
+    Returns:
+        list of str: The list of text contents from the selected <p> tags.
+    """
+    return select_paragraphs(extract_all_paragraphs(html), query)
+
+
+def refine_paragraphs(
+    page_paragraphs, query=None, token_budget=DEFAULT_TOKEN_BUDGET, deduplicator=None
+):
+    """
+    Drops the repeated paragraphs of the pages, then keeps the most relevant ones.
+
+    Parameters:
+        page_paragraphs (list of list of str): The paragraphs of each page (None for failed pages).
+        query (str, optional): The user query the paragraphs are ranked against.
+        token_budget (int, optional): The most tokens of paragraphs kept across all the pages.
+        deduplicator (ParagraphDeduplicator, optional): Remembers the paragraphs already
+            sent to the model by other searches.
+
+    Returns:
+        list of str: The kept paragraphs, page after page.
+    """
+
+    def rank(pages):
+        return rank_paragraphs(query or "", pages, token_budget=token_budget)
+
+    if deduplicator is not None:
+        # ? Filtered, ranked and remembered in one step, so concurrent searches see each other
+        ranked = deduplicator.claim(page_paragraphs, rank)
+    else:
+        ranked = rank(page_paragraphs)
+    all_paragraph_texts = []
+    for paragraphs in ranked:
+        all_paragraph_texts.extend(paragraphs)
+    return all_paragraph_texts
+
+
+async def main(
+    urls,
+    query=None,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    deduplicator=None,
+    mode=None,
+):
     """
     The main coroutine that fetches HTML content from a list of URLs and extracts
     text from <p> tags.
 
     Parameters:
         urls (list of str): The list of URLs to process.
+        query (str, optional): The user query the paragraphs are ranked against.
+        token_budget (int, optional): The most tokens of paragraphs kept across all the pages.
+        deduplicator (ParagraphDeduplicator, optional): Drops the repeated paragraphs.
+        mode (str, optional): The search mode, which sets how long slow pages are
+            waited for (one of `SEARCH_MODE_DEADLINES`; every page is waited for by default).
 
     Returns:
         list of str: The aggregated list of paragraph texts from all URLs.
     """
-    html_contents = await fetch_all_html(urls)
-    all_paragraph_texts = []
-    for html in html_contents:
-        if html:
-            paragraphs = extract_paragraph_texts(html)
-            all_paragraph_texts.extend(paragraphs)
-    return all_paragraph_texts
+    page_paragraphs = await fetch_all_paragraphs(
+        urls, *SEARCH_MODE_DEADLINES.get(mode, (None, None))
+    )
+    # ? Off the event loop, so the pages of concurrent searches keep downloading
+    return await asyncio.to_thread(
+        refine_paragraphs, page_paragraphs, query, token_budget, deduplicator
+    )
+
+
+def crawlable_urls(urls: list) -> list:
+    """
+    Leaves out PDFs and the URLs of hosts that keep failing or yield no paragraphs
+    (see `utils.domain_health`), and moves those of slow hosts last.
+    """
+    return DOMAIN_HEALTH.plan([url for url in urls if ".pdf" not in url])
 
 
-def fetch_text(urls: list) -> str:
+def fetch_text(
+    urls: list,
+    query: str = None,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    deduplicator: ParagraphDeduplicator = None,
+    mode: str = None,
+) -> str:
     """
     Does a deep search on the given URLs and returns the refined paragraph texts.
 
+    Paragraphs repeated across the pages (syndicated articles, mirrors) are dropped,
+    then the rest are ranked against the query, and only the most relevant ones
+    (at most 5 per page) are kept within the token budget.
+
     Args:
         urls (list): The list of URLs to search.
+        query (str, optional): The query the URLs were found with.
+        token_budget (int, optional): The most tokens returned (None for no limit).
+        deduplicator (ParagraphDeduplicator, optional): Shared by the searches of an agentic
+            plan, so their results don't repeat each other. A new one is used by default.
+        mode (str, optional): The search mode (one of `SEARCH_MODE_DEADLINES`), which
+            sets when to stop waiting for slow pages. Every page is waited for by default.
 
     Returns:
         list: The list of refined paragraph texts.
     """
-    urls = [
-        url
-        for url in urls
-        if "amazon." not in url
-        and "flipkart." not in url
-        and "youtube." not in url
-        and "zomato." not in url
-        and ".pdf" not in url
-    ]  # Exclude Amazon and Flipkart URLs since they don't allow scraping
+    urls = crawlable_urls(urls)
     for url in urls:
         print(f"Fetching text from {url}")
-    paragraph_texts = asyncio.run(main(urls))
-    text_body = " ".join(text for text in paragraph_texts)
+    if deduplicator is None:
+        deduplicator = ParagraphDeduplicator()
+    paragraph_texts = PAGE_FETCHER.run(
+        main(urls, query, token_budget, deduplicator, mode)
+    )
+    text_body = "\n".join(text for text in paragraph_texts)  # ? One paragraph per line
     return text_body
+
+
+def fetch_passages(urls: list, query: str = None, mode: str = None) -> list:
+    """
+    Does a deep search on the given URLs and returns every paragraph of each page,
+    without repeats and ordered by relevance, for the caller to pack into its own budget.
+
+    Args:
+        urls (list): The list of URLs to search.
+        query (str, optional): The query the URLs were found with.
+        mode (str, optional): The search mode (one of `SEARCH_MODE_DEADLINES`), which
+            sets when to stop waiting for slow pages. Every page is waited for by default.
+
+    Returns:
+        list: The paragraphs of each crawlable URL (most relevant first), in the order of the URLs.
+    """
+    urls = crawlable_urls(urls)
+    for url in urls:
+        print(f"Fetching text from {url}")
+    page_paragraphs = PAGE_FETCHER.run(
+        fetch_all_paragraphs(urls, *SEARCH_MODE_DEADLINES.get(mode, (None, None)))
+    )
+    page_paragraphs = ParagraphDeduplicator().unique(page_paragraphs)
+    return sort_by_relevance(query or "", page_paragraphs)
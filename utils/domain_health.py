@@ -0,0 +1,231 @@
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from utils.cache import TwoTierCache
+
+# Past outcomes count half as much after this long (seconds), so blocked hosts get retried
+HALF_LIFE = 3 * 24 * 3600
+# (Decayed) fetches needed before a host is judged, i.e. three recent ones
+MIN_ATTEMPTS = 2.5
+# Hosts are skipped below this success rate, or below this many useful paragraphs per fetch
+MIN_SUCCESS_RATE = 0.25
+MIN_USEFUL_PARAGRAPHS = 1.0
+# Hosts are fetched last above this p95 latency (seconds) or below this success rate
+SLOW_P95 = 3.0
+UNRELIABLE_SUCCESS_RATE = 0.6
+# Latency samples kept per host
+LATENCY_SAMPLES = 32
+
+# Hosts that block scrapers, previously excluded with a hard-coded list. They start
+# out as failing hosts, and are only tried again once their record has decayed.
+SEED_BLOCKED = ("amazon.", "flipkart.", "youtube.", "zomato.")
+SEED_FAILURES = 12
+
+HEALTH_CACHE = TwoTierCache(
+    "domain_health",
+    ttl=30 * 24 * 3600,
+    max_items=2048,
+    max_bytes=10 * 1024 * 1024,
+)
+
+
+def domain_of(url: str) -> str:
+    """Returns the host name of the URL without its `www.` prefix."""
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def is_seeded(domain: str) -> bool:
+    """Whether the host is one of `SEED_BLOCKED`, matched on whole host labels."""
+    return any(("." + seed) in ("." + domain + ".") for seed in SEED_BLOCKED)
+
+
+def _new_record(now: float, failures: float = 0.0) -> dict:
+    return {
+        "attempts": failures,
+        "successes": 0.0,
+        "useful": 0.0,
+        "latencies": [],
+        "last_failure": now if failures else None,
+        "last_failure_reason": "seed" if failures else None,
+        "updated": now,
+    }
+
+
+def _decay(record: dict, now: float) -> dict:
+    """Returns a copy of the record with its counters decayed up to `now`."""
+    factor = 0.5 ** (max(0.0, now - record["updated"]) / HALF_LIFE)
+    record = dict(record)
+    for counter in ("attempts", "successes", "useful"):
+        record[counter] *= factor
+    record["updated"] = now
+    return record
+
+
+class DomainHealth:
+    """
+    Tracks how every host behaves when crawled, persisted across sessions.
+
+    Each host keeps exponentially decayed counts of its fetches, successes and
+    useful paragraphs, its recent latencies and its last failure. Hosts that
+    mostly fail (or never yield paragraphs) are skipped, and slow or unreliable
+    ones are fetched last. As the counts decay, skipped hosts fall back below
+    `MIN_ATTEMPTS` and get another chance.
+    """
+
+    def __init__(self, cache: TwoTierCache = HEALTH_CACHE):
+        self._cache = cache
+        self._lock = threading.Lock()
+
+    def _load(self, domain: str, now: float) -> dict:
+        record = self._cache.get(domain)
+        if record is not None:
+            return _decay(record, now)
+        if is_seeded(domain):
+            # ? Persisted, so the seeded failures decay like observed ones
+            record = _new_record(now, failures=SEED_FAILURES)
+            self._cache.set(domain, record)
+            return record
+        return _new_record(now)
+
+    def record(
+        self,
+        url: str,
+        ok: bool,
+        latency: float,
+        paragraphs: int = 0,
+        reason: str = None,
+    ) -> None:
+        """
+        Records the outcome of a fetch.
+
+        Args:
+            url (str): The URL fetched.
+            ok (bool): Whether the page was received.
+            latency (float): The seconds the fetch took.
+            paragraphs (int): The substantial paragraphs found on the page.
+            reason (str, optional): Why the fetch failed (e.g. "HTTP 403", "timeout").
+        """
+        domain = domain_of(url)
+        if not domain:
+            return
+        now = time.time()
+        with self._lock:
+            record = self._load(domain, now)
+            record["attempts"] += 1
+            record["latencies"] = (record["latencies"] + [round(latency, 3)])[
+                -LATENCY_SAMPLES:
+            ]
+            if ok:
+                record["successes"] += 1
+                record["useful"] += paragraphs
+            else:
+                record["last_failure"] = now
+                record["last_failure_reason"] = reason
+            self._cache.set(domain, record)
+
+    def record_slow(self, url: str, latency: float) -> None:
+        """
+        Records a fetch abandoned at the soft deadline while the page was still loading.
+
+        The host answered too slowly rather than refusing, so the fetch counts as
+        a success with the host's usual paragraphs per fetch: only its latency
+        changes, which moves it to the deprioritized hosts instead of the skipped ones.
+
+        Args:
+            url (str): The URL fetched.
+            latency (float): The seconds the page was allowed to take (at least `SLOW_P95`).
+        """
+        domain = domain_of(url)
+        if not domain:
+            return
+        now = time.time()
+        with self._lock:
+            record = self._load(domain, now)
+            usual = (
+                record["useful"] / record["attempts"]
+                if record["attempts"]
+                else MIN_USEFUL_PARAGRAPHS
+            )
+            record["attempts"] += 1
+            record["successes"] += 1
+            record["useful"] += usual
+            record["latencies"] = (
+                record["latencies"] + [round(max(latency, SLOW_P95), 3)]
+            )[-LATENCY_SAMPLES:]
+            self._cache.set(domain, record)
+
+    def report(self, url: str) -> dict:
+        """
+        Returns the health of the host of the URL.
+
+        Args:
+            url (str): A URL (or bare host name) of the host.
+
+        Returns:
+            dict: The decayed attempts, success rate, p50/p95 latency, useful
+            paragraphs per fetch and last failure of the host.
+        """
+        domain = domain_of(url) if "/" in url else url.lower()
+        with self._lock:
+            record = self._load(domain, time.time())
+        latencies = np.array(record["latencies"] or [0.0])
+        attempts = record["attempts"]
+        return {
+            "domain": domain,
+            "attempts": attempts,
+            "success_rate": record["successes"] / attempts if attempts else 1.0,
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "useful_paragraphs": record["useful"] / attempts if attempts else 0.0,
+            "last_failure": record["last_failure"],
+            "last_failure_reason": record["last_failure_reason"],
+        }
+
+    def verdict(self, url: str) -> str:
+        """
+        Decides how to treat the host of the URL.
+
+        Returns:
+            str: "skip", "deprioritize" or "fetch".
+        """
+        report = self.report(url)
+        if report["attempts"] < MIN_ATTEMPTS:
+            return "fetch"
+        if (
+            report["success_rate"] < MIN_SUCCESS_RATE
+            or report["useful_paragraphs"] < MIN_USEFUL_PARAGRAPHS
+        ):
+            return "skip"
+        if report["p95"] > SLOW_P95 or report["success_rate"] < UNRELIABLE_SUCCESS_RATE:
+            return "deprioritize"
+        return "fetch"
+
+    def plan(self, urls: list) -> list:
+        """
+        Drops the URLs of failing hosts and moves those of slow or unreliable hosts last.
+
+        Args:
+            urls (list): The URLs to crawl, in order of preference.
+
+        Returns:
+            list: The URLs worth crawling, healthy hosts first (otherwise in the given order).
+        """
+        healthy, slow = [], []
+        for url in urls:
+            verdict = self.verdict(url)
+            if verdict == "skip":
+                logging.info(f"Skipping {url}: {self.report(url)}")
+            elif verdict == "deprioritize":
+                slow.append(url)
+            else:
+                healthy.append(url)
+        return healthy + slow
+
+
+# Shared by every deep search of the app process
+DOMAIN_HEALTH = DomainHealth()
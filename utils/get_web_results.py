@@ -1,8 +1,15 @@
 from duckduckgo_search import DDGS
-from duckduckgo_search.exceptions import TimeoutException, DuckDuckGoSearchException
+from duckduckgo_search.exceptions import (
+    TimeoutException,
+    DuckDuckGoSearchException,
+    RatelimitException,
+)
 from utils.extract_subs import filter_links
-import time
+from utils.rate_limits import SEARCH_PACER
+from utils.search_cache import cached_search
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 # ! Experimental Section
 # ? Uncomment the following code to use Groq API for generating search string
@@ -85,6 +92,140 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+# Runs the text and image searches side by side
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ddgs")
+
+
+def _search_with_retries(kind: str, search, retries=3, delay=2, backoff_factor=2):
+    """
+    Runs one DuckDuckGo search (text or images), retrying it on its own.
+
+    Args:
+        kind (str): The kind of search, for logging.
+        search (callable): Called with a `DDGS` session, returns the search results.
+        retries (int): The number of retries to attempt if an error occurs.
+        delay (int): The delay before the first retry (only applied after a failure).
+        backoff_factor (int): The factor to increase the delay between retries.
+
+    Returns:
+        list: The search results, or None if the search failed.
+    """
+    for attempt in range(retries):
+        try:
+            logging.info(f"Attempt {attempt + 1} for the {kind} search")
+            SEARCH_PACER.wait("duckduckgo")
+            # ? A DDGS session refuses further calls once one of its calls failed, so every
+            # ? attempt (and every concurrent search) gets a session of its own
+            results = search(DDGS())
+            SEARCH_PACER.record_success("duckduckgo")
+            return results
+
+        except (TimeoutException, RatelimitException) as e:
+            logging.error(
+                f"{kind.capitalize()} search failed: {e}. Retrying {attempt + 1}/{retries}..."
+            )
+            # Back off only as long as the failures so far require
+            SEARCH_PACER.record_failure(
+                "duckduckgo", base_delay=delay, factor=backoff_factor
+            )
+        except DuckDuckGoSearchException as e:
+            logging.error(f"Error occurred during DuckDuckGo {kind} search: {e}")
+            return None
+        except Exception as e:
+            logging.error(f"An unexpected error occurred in the {kind} search: {e}")
+            return None
+
+    logging.error(f"Failed to retrieve {kind} results after several attempts.")
+    return None
+
+
+def _cached_search(kind: str, query, region, max_results, search, **retry_options):
+    """
+    Runs one DuckDuckGo search through the shared search cache.
+
+    Args:
+        kind (str): The kind of search ("text" or "image").
+        query (str): The search query.
+        region (str): The region to search in.
+        max_results (int): The maximum number of results to return.
+        search (callable): Called with a `DDGS` session, returns the search results.
+        **retry_options: The retry arguments of `_search_with_retries`.
+
+    Returns:
+        list: The search results, or None if the search failed.
+    """
+
+    def fetch():
+        return _search_with_retries(kind, search, **retry_options)
+
+    provider = "ddgs_text" if kind == "text" else "ddgs_images"
+    return cached_search(provider, query, fetch, region=region, count=max_results)
+
+
+def _search_functions(query: str, max_results: int, region: str) -> tuple:
+    """Returns the text and image searches of the query, each taking a `DDGS` session."""
+
+    def text_search(ddgs: DDGS):
+        return ddgs.text(query, region=region, max_results=max_results)
+
+    def image_search(ddgs: DDGS):
+        return ddgs.images(
+            keywords=query,
+            region=region,
+            safesearch="off",
+            size=None,
+            type_image=None,
+            layout=None,
+            license_image=None,
+            max_results=max_results,
+        )
+
+    return text_search, image_search
+
+
+def _format_results(results: list, img_results: list) -> tuple:
+    """
+    Builds the model prompt and the references out of the text and image results.
+
+    Returns:
+        body (str): The body containing information from the search results.
+        img_links (list): The list of image links from the search results.
+        video_links (list): The list of video links from the search results.
+        markdown_placeholder (str): The placeholder containing the references to the search results.
+    """
+    video_links = []
+    img_links = []
+    markdown_placeholder = """"""
+    body = """<instructions>Refer these results from the web and respond to the user: </instructions>\n"""
+
+    if results:
+        for idx, search_result in enumerate(results):
+            body += f"<result {idx}>\n{search_result['body']}\n</result {idx}>\n"
+            video_links_from_search = filter_links(search_result["href"])
+
+            if not video_links_from_search:
+                markdown_placeholder += f"- {search_result['href']}\n"
+            else:
+                video_links.extend(video_links_from_search)
+
+    if img_results:
+        for idx, image_result in enumerate(img_results):
+            video_links_from_img_search = filter_links(image_result["url"])
+            if not video_links_from_img_search:
+                markdown_placeholder += f"- {image_result['url']}\n"
+            else:
+                video_links.extend(video_links_from_img_search)
+            img_links.append(image_result["image"])
+
+    body += """\n<instructions>The above results might contain irrelevant information. Determine the relevance of the information and respond to the user accordingly.
+                        Do not include the text within brackets in your response. </instructions>"""
+
+    # Remove duplicates
+    img_links = list(set(img_links))
+    video_links = list(set(video_links))
+
+    return body, img_links, video_links, markdown_placeholder
+
 
 def search_the_web(
     user_query,
@@ -98,12 +239,16 @@ def search_the_web(
     """
     Search the web using DuckDuckGo search engine and return the results.
 
+    The text and image searches run concurrently, each on its own DDGS session, and
+    are retried independently, so a failed image search neither delays nor discards
+    the text results.
+
     Args:
         user_query (str): The query to search the web.
         max_results (int): The maximum number of results to return.
         region (str): The region to search in.
         retries (int): The number of retries to attempt if an error occurs.
-        delay (int): The delay between retries.
+        delay (int): The delay before the first retry (only applied after a failure).
         backoff_factor (int): The factor to increase the delay between retries.
         api_key (str): The API key for Groq API.
 
@@ -113,107 +258,108 @@ def search_the_web(
         video_links (list): The list of video links from the search results.
         markdown_placeholder (str): The placeholder containing the references to the search results.
     """
-    if user_query:
-        query = user_query
-
-        for attempt in range(retries):
-            try:
-                logging.info(f"Attempt {attempt + 1} for query: {query}")
-
-                # ! Experimental Section
-                # ? Uncomment the following code to use Groq API for generating search string
-                # search_prompt = (
-                #     "<instructions>Given the following query, return an appropriate search string: </instructions>\n"
-                #     + query
-                #     + "\n<instructions>Only return the search string, do not return any other information.</instructions>"
-                # )
-
-                # client = Groq(api_key=api_key)
-                # messages = {"role": "user", "content": search_prompt}
-                # chat_completion = client.chat.completions.create(
-                #     model="llama3-70b-8192",
-                #     messages=messages,
-                #     max_tokens=50,
-                # )
-                # query = chat_completion.choices[0].message.content
-
-                results = DDGS().text(query, region=region, max_results=max_results)
-                img_results = DDGS().images(
-                    keywords=query,
-                    region=region,
-                    safesearch="off",
-                    size=None,
-                    type_image=None,
-                    layout=None,
-                    license_image=None,
-                    max_results=max_results,
-                )
-
-                video_links = []
-                img_links = []
-                markdown_placeholder = """"""
-                body = """<instructions>Refer these results from the web and respond to the user: </instructions>\n"""
-
-                if results:
-                    for idx, search_result in enumerate(results):
-                        body += f"<result {idx}>\n{search_result['body']}\n</result {idx}>\n"
-                        video_links_from_search = filter_links(search_result["href"])
-
-                        if not video_links_from_search:
-                            markdown_placeholder += f"- {search_result['href']}\n"
-                        else:
-                            video_links.extend(video_links_from_search)
-
-                if img_results:
-                    for idx, image_result in enumerate(img_results):
-                        video_links_from_img_search = filter_links(image_result["url"])
-                        if not video_links_from_img_search:
-                            markdown_placeholder += f"- {image_result['url']}\n"
-                        else:
-                            video_links.extend(video_links_from_img_search)
-                        img_links.append(image_result["image"])
-
-                body += """\n<instructions>The above results might contain irrelevant information. Determine the relevance of the information and respond to the user accordingly.
-                        Do not include the text within brackets in your response. </instructions>"""
+    if not user_query:
+        return None
+
+    query = user_query
+
+    # ! Experimental Section
+    # ? Uncomment the following code to use Groq API for generating search string
+    # search_prompt = (
+    #     "<instructions>Given the following query, return an appropriate search string: </instructions>\n"
+    #     + query
+    #     + "\n<instructions>Only return the search string, do not return any other information.</instructions>"
+    # )
+
+    # client = Groq(api_key=api_key)
+    # messages = {"role": "user", "content": search_prompt}
+    # chat_completion = client.chat.completions.create(
+    #     model="llama3-70b-8192",
+    #     messages=messages,
+    #     max_tokens=50,
+    # )
+    # query = chat_completion.choices[0].message.content
+
+    text_search, image_search = _search_functions(query, max_results, region)
+    retry_options = {
+        "retries": retries,
+        "delay": delay,
+        "backoff_factor": backoff_factor,
+    }
+
+    text_future = _EXECUTOR.submit(
+        _cached_search,
+        "text",
+        query,
+        region,
+        max_results,
+        text_search,
+        **retry_options,
+    )
+    img_future = _EXECUTOR.submit(
+        _cached_search,
+        "image",
+        query,
+        region,
+        max_results,
+        image_search,
+        **retry_options,
+    )
+    results, img_results = text_future.result(), img_future.result()
+
+    if results is None and img_results is None:
+        return None, None, None, None
+    return _format_results(results, img_results)
+
+
+async def search_the_web_async(
+    user_query,
+    max_results=12,
+    region="ie-en",
+    retries=3,
+    delay=2,
+    backoff_factor=2,
+) -> tuple:
+    """
+    Async variant of `search_the_web` (same arguments and return values).
+
+    The blocking DDGS calls run in worker threads, so the event loop stays free
+    while both searches are in flight.
+    """
+    if not user_query:
+        return None
+
+    text_search, image_search = _search_functions(user_query, max_results, region)
+    retry_options = {
+        "retries": retries,
+        "delay": delay,
+        "backoff_factor": backoff_factor,
+    }
+
+    results, img_results = await asyncio.gather(
+        asyncio.to_thread(
+            _cached_search,
+            "text",
+            user_query,
+            region,
+            max_results,
+            text_search,
+            **retry_options,
+        ),
+        asyncio.to_thread(
+            _cached_search,
+            "image",
+            user_query,
+            region,
+            max_results,
+            image_search,
+            **retry_options,
+        ),
+    )
 
-                # Remove duplicates
-                img_links = list(set(img_links))
-                video_links = list(set(video_links))
-
-                # logging.info(f"Results: {results}")
-                # logging.info(f"Image Results: {img_results}")
-
-                return body, img_links, video_links, markdown_placeholder
-
-            except TimeoutException as e:
-                logging.error(
-                    f"Timeout occurred: {e}. Retrying {attempt + 1}/{retries}..."
-                )
-                time.sleep(delay)
-                delay *= backoff_factor  # Exponential backoff
-            except DuckDuckGoSearchException as e:
-                logging.error(f"Error occurred during DuckDuckGo search: {e}")
-                return None, None, None, None
-            # ! Experimental Section
-            # ? Uncomment the following code to handle errors from Groq API
-            # except groq.RateLimitError:
-            #     logging.error("Rate limit error occurred. Retrying...")
-            #     return None, None, None, None
-            # except groq.AuthenticationError:
-            #     logging.error("Authentication error occurred. Retrying...")
-            #     return None, None, None, None
-            # except groq.BadRequestError:
-            #     logging.error("Bad request error occurred. Retrying...")
-            #     return None, None, None, None
-            # except groq.InternalServerError:
-            #     logging.error("Internal server error occurred. Retrying...")
-            #     return None, None, None, None
-            except Exception as e:
-                logging.error(f"An unexpected error occurred: {e}")
-                return None, None, None, None
-
-        logging.error("Failed to retrieve results after several attempts.")
+    if results is None and img_results is None:
         return None, None, None, None
+    return _format_results(results, img_results)
 
 
 # Example usage
@@ -1,10 +1,51 @@
 import json
 import groq
-from groq import Groq
 from serpapi import GoogleSearch
-from concurrent.futures import ThreadPoolExecutor
-from utils.deep_search import fetch_text
+from concurrent.futures import ThreadPoolExecutor, wait
+from utils.deep_search import fetch_passages
+from utils.passage_packer import pack_passages
+from utils.tokens import estimate_tokens
 from utils.extract_subs import filter_links
+from utils.groq_client import get_groq_client
+from utils.search_cache import cached_search
+
+# Shared by the concurrent searches of every request
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="serpapi")
+
+# Tokens of web results sent when the caller doesn't size them for its model
+DEFAULT_DEEP_SEARCH_TOKENS = 6000
+# Below this many tokens of crawled text, the search snippets are used instead
+MIN_DEEP_SEARCH_TOKENS = 130
+
+DEEP_SEARCH_INSTRUCTIONS = """<instructions>Refer these results from the web and respond to the user: </instructions>\n"""
+RELEVANCE_INSTRUCTIONS = """\n<instructions>The above results might contain irrelevant information. Determine the relevance of the information and respond to the user accordingly.
+                    Do not include the text within tags in your response. </instructions>"""
+
+
+def google_search(provider: str, params: dict) -> dict:
+    """
+    Runs a SerpApi search through the shared search cache.
+
+    The API key is left out of the cache key, so every session shares the results.
+
+    Args:
+        provider (str): The cache provider name (one of `SEARCH_TTLS`).
+        params (dict): The SerpApi parameters.
+
+    Returns:
+        dict: The search results.
+    """
+    search_params = {
+        key: value for key, value in params.items() if key not in ("api_key", "q")
+    }
+    return cached_search(
+        provider,
+        params.get("q"),
+        lambda: GoogleSearch(params).get_dict(),
+        region=sorted(search_params.items()),
+        count=params.get("num"),
+        is_valid=lambda results: bool(results) and "error" not in results,
+    )
 
 
 # for formatting the search results
@@ -26,22 +67,39 @@ def perform_shallow_search(search_results: dict) -> tuple:
 
 
 # for formatting the search results
-def perform_deep_search(search_results: list) -> str:
-    body = """"""
+def perform_deep_search(
+    search_results: list, query: str = None, token_budget=DEFAULT_DEEP_SEARCH_TOKENS
+) -> tuple:
+    """
+    Crawls the organic results and packs their most relevant paragraphs into the budget.
+
+    Args:
+        search_results (dict): The SerpApi search results.
+        query (str): The query the results were found with.
+        token_budget (int): The tokens the returned body may take.
+
+    Returns:
+        body (str): The packed paragraphs of every source.
+        markdown_placeholder (str): The references to the search results.
+        tokens (int): The estimated tokens of the body.
+    """
     markdown_placeholder = """"""
     all_links = []
-    search_result_snippets = []
     for _, search_result in enumerate(search_results["organic_results"]):
         all_links.append(search_result["link"])
-        search_result_snippets.append(search_result["snippet"])
         markdown_placeholder += (
             f"- [**{search_result['source']}**]({search_result['link']})\n"
         )
 
-    paragraph_texts = fetch_text(all_links)
-    body += """<instructions>Refer these results from the web and respond to the user: </instructions>\n"""
-    body += paragraph_texts
-    return body, markdown_placeholder
+    source_passages = fetch_passages(all_links, query, mode="serp")
+    packed, tokens = pack_passages(
+        source_passages, token_budget - estimate_tokens(DEEP_SEARCH_INSTRUCTIONS)
+    )
+    body = DEEP_SEARCH_INSTRUCTIONS
+    for idx, passages in enumerate(packed):
+        if passages:
+            body += f"<result {idx}>\n" + "\n".join(passages) + f"\n</result {idx}>\n"
+    return body, markdown_placeholder, tokens
 
 
 def search_the_web(
@@ -55,6 +113,7 @@ def search_the_web(
     gl="in",
     location="Kolkata, West Bengal, India",
     safe="off",
+    token_budget=None,
 ) -> tuple:
     """
     Search the web using Google search engine and return the results.
@@ -70,6 +129,8 @@ def search_the_web(
         location (str): The location to search in.
         safe (str): The safe search mode.
         deep_search (bool): Whether to perform a deep search or not.
+        token_budget (int): The tokens the body may take in the prompt of the model
+            (`DEFAULT_DEEP_SEARCH_TOKENS` if not given).
 
     Returns:
         body (str): The body containing information from the search results.
@@ -83,10 +144,11 @@ def search_the_web(
 
     if not api_key and q:
         body_text += f"Please provide an API key to search the web for {q}\n"
-        return body_text, markdown_placeholder
+        return body_text, markdown_placeholder, related_questions
 
     try:
-        search_results = GoogleSearch(
+        search_results = google_search(
+            "serpapi",
             {
                 "api_key": api_key,
                 "engine": engine,
@@ -97,8 +159,8 @@ def search_the_web(
                 "location": location,
                 "safe": safe,
                 "num": num,
-            }
-        ).get_dict()
+            },
+        )
 
         if "related_questions" in search_results.keys():
             related_questions = search_results["related_questions"]
@@ -116,10 +178,18 @@ def search_the_web(
         #     return body_text, markdown_placeholder
         # else:
         try:  # ? Perform deep search by default; If an error occurs, perform a shallow search
-            body, markdown_placeholder = perform_deep_search(search_results)
+            #! The crawled text fills what the answer box and closing instructions leave of the budget
+            deep_search_budget = (
+                (DEFAULT_DEEP_SEARCH_TOKENS if token_budget is None else token_budget)
+                - estimate_tokens(body_text)
+                - estimate_tokens(RELEVANCE_INSTRUCTIONS)
+            )
+            body, markdown_placeholder, body_tokens = perform_deep_search(
+                search_results, q, deep_search_budget
+            )
             if body:
-                # If there are not enough words in the body, we perform a shallow search
-                if len(body.split()) < 100:
+                # If there is not enough text in the body, we perform a shallow search
+                if body_tokens < MIN_DEEP_SEARCH_TOKENS:
                     body, markdown_placeholder = perform_shallow_search(search_results)
                     body_text += body
                     return (
@@ -127,16 +197,9 @@ def search_the_web(
                         markdown_placeholder,
                         related_questions,
                     )  # ? Return the shallow search results
-                print("Performed deep search!")
+                print(f"Performed deep search! (~{body_tokens} tokens)")
                 body_text += body
-                if (
-                    len(body_text.split(" ")) > 4500
-                ):  # ? Setting a hard limit of 4500 words, might need to adjust
-                    # ! There is a potential to summarize the text here instead of truncating
-                    # ! Use LLM for summarization
-                    body_text = " ".join(body_text.split(" ")[:4500])
-                    body_text += """\n<instructions>The above results might contain irrelevant information. Determine the relevance of the information and respond to the user accordingly.
-                    Do not include the text within tags in your response. </instructions>"""
+                body_text += RELEVANCE_INSTRUCTIONS
                 return (
                     body_text,
                     markdown_placeholder,
@@ -145,15 +208,13 @@ def search_the_web(
             else:  # ? If the body is empty, perform a shallow search
                 body, markdown_placeholder = perform_shallow_search(search_results)
                 body_text += body
-                body_text += """\n<instructions>The above results might contain irrelevant information. Determine the relevance of the information and respond to the user accordingly.
-                    Do not include the text within tags in your response. </instructions>"""
+                body_text += RELEVANCE_INSTRUCTIONS
                 return body_text, markdown_placeholder, related_questions
         except Exception as e:
             print(e)
             print("Error in deep search. Performing shallow search.")
             body, markdown_placeholder = perform_shallow_search(search_results)
-            body_text += """\n<instructions>The above results might contain irrelevant information. Determine the relevance of the information and respond to the user accordingly.
-                    Do not include the text within tags in your response. </instructions>"""
+            body_text += RELEVANCE_INSTRUCTIONS
             return body, markdown_placeholder, related_questions
 
     except Exception as e:
@@ -196,7 +257,8 @@ def search_images(
         return img_links
 
     try:
-        img_search_results = GoogleSearch(
+        img_search_results = google_search(
+            "serpapi_images",
             {
                 "api_key": api_key,
                 "engine": engine,
@@ -207,8 +269,8 @@ def search_images(
                 "location": location,
                 "safe": safe,
                 "tbm": tbm,
-            }
-        ).get_dict()
+            },
+        )
 
         for _, image_result in enumerate(img_search_results["images_results"]):
             img_links.append(image_result["original"])
@@ -255,7 +317,8 @@ def search_videos(
         return video_links
 
     try:
-        video_search_results = GoogleSearch(
+        video_search_results = google_search(
+            "serpapi_videos",
             {
                 "api_key": api_key,
                 "engine": engine,
@@ -267,8 +330,8 @@ def search_videos(
                 "safe": safe,
                 "tbm": tbm,
                 "num": num,
-            }
-        ).get_dict()
+            },
+        )
 
         for _, video_result in enumerate(video_search_results["video_results"]):
             video_links.append(video_result["link"])
@@ -279,65 +342,20 @@ def search_videos(
         return video_links
 
 
-def get_web_results(
-    api_key=None,
-    groq_api_key=None,
-    query=None,
-    location="Kolkata, West Bengal, India",
-    deep_search=False,
-    max_results=10,
-) -> tuple:
+def search_maps(api_key=None, groq_api_key=None, query=None) -> str:
     """
-    Search the web using Google search engine and return the results.
+    Search Google Maps if the query would benefit from a map.
 
-    This is the main function that orchestrates the search of the web using Google search engine.
-    It uses the `search_the_web`, `search_images`, and `search_videos` functions to get the search results.
+    A small model first decides whether a map is needed and writes the Maps query.
 
     Args:
         api_key (str): The API key for SerpApi.
         groq_api_key (str): The API key for Groq.
-        query (str): The query to search the web.
-        location (str): The location to search in.
-        max_results (int): The maximum number of results to return.
+        query (str): The query of the user.
 
-    Returns
-        - body (str): The body containing information from the search results.
-        - img_links (list): The list of image links from the search results.
-        - video_links (list): The list of video links from the search results.
-        - MARKDOWN_PLACEHOLDER (str): The placeholder containing the references to the search results.
-        - related_questions (dict): The dict of related questions from the search results.
-        - map_results (str): The dict of map results from the search results.
+    Returns:
+        maps_search_results (str): The JSON encoded map results, or None if no map is needed.
     """
-
-    params = {
-        "api_key": api_key,
-        "engine": "google",
-        "q": query,
-        "google_domain": "google.com",
-        "hl": "en",
-        "gl": "in",
-        "location": location,
-        "safe": "off",
-    }
-
-    yt_links = None
-    with ThreadPoolExecutor() as executor:
-        body, markdown_placeholder, related_questions = executor.submit(
-            search_the_web,
-            num=max_results,
-            deep_search=deep_search,
-            **params,
-        ).result()
-        print("Got the body and markdown_placeholder")
-        img_links = executor.submit(search_images, tbm="isch", **params).result()
-        print("Got the img_links")
-        video_links = executor.submit(
-            search_videos, num=max_results, tbm="vid", **params
-        ).result()
-        print("Got the video_links")
-        if video_links:
-            yt_links = filter_links(" ".join(video_links))
-
     try:
         prompt = f"""
         # Google Maps Agent Prompt Template
@@ -389,7 +407,7 @@ def get_web_results(
         {query}
         """
 
-        gmaps_client = Groq(api_key=groq_api_key)
+        gmaps_client = get_groq_client(groq_api_key)
         completion = gmaps_client.chat.completions.create(
             model="gemma2-9b-it",
             messages=[
@@ -412,8 +430,9 @@ def get_web_results(
                 "api_key": api_key,
             }
 
-            search = GoogleSearch(gmaps_params)
-            maps_search_results = json.dumps(search.get_dict())
+            maps_search_results = json.dumps(
+                google_search("serpapi_maps", gmaps_params)
+            )
         else:
             maps_search_results = None
             print("Google Maps not needed.")
@@ -422,6 +441,101 @@ def get_web_results(
         print(e)
         maps_search_results = None
 
+    return maps_search_results
+
+
+def get_web_results(
+    api_key=None,
+    groq_api_key=None,
+    query=None,
+    location="Kolkata, West Bengal, India",
+    deep_search=False,
+    max_results=10,
+    deadline=30,
+    token_budget=None,
+) -> tuple:
+    """
+    Search the web using Google search engine and return the results.
+
+    This is the main function that orchestrates the search of the web using Google search engine.
+    It runs the `search_the_web`, `search_images`, `search_videos` and `search_maps` functions concurrently.
+
+    Args:
+        api_key (str): The API key for SerpApi.
+        groq_api_key (str): The API key for Groq.
+        query (str): The query to search the web.
+        location (str): The location to search in.
+        max_results (int): The maximum number of results to return.
+        deadline (float): Seconds to wait for the searches; the ones still running are left out.
+        token_budget (int): The tokens the body may take in the prompt of the model.
+
+    Returns
+        - body (str): The body containing information from the search results.
+        - img_links (list): The list of image links from the search results.
+        - video_links (list): The list of video links from the search results.
+        - MARKDOWN_PLACEHOLDER (str): The placeholder containing the references to the search results.
+        - related_questions (dict): The dict of related questions from the search results.
+        - map_results (str): The dict of map results from the search results.
+    """
+
+    params = {
+        "api_key": api_key,
+        "engine": "google",
+        "q": query,
+        "google_domain": "google.com",
+        "hl": "en",
+        "gl": "in",
+        "location": location,
+        "safe": "off",
+    }
+
+    # ? All the searches are independent, so they are issued at once and the
+    # ? wall time is bounded by the slowest of them (or the deadline)
+    futures = {
+        "web": _EXECUTOR.submit(
+            search_the_web,
+            num=max_results,
+            deep_search=deep_search,
+            token_budget=token_budget,
+            **params,
+        ),
+        "images": _EXECUTOR.submit(search_images, tbm="isch", **params),
+        "videos": _EXECUTOR.submit(search_videos, num=max_results, tbm="vid", **params),
+        "maps": _EXECUTOR.submit(
+            search_maps, api_key=api_key, groq_api_key=groq_api_key, query=query
+        ),
+    }
+    defaults = {
+        "web": ("", "", None),
+        "images": [],
+        "videos": [],
+        "maps": None,
+    }
+    _, not_done = wait(futures.values(), timeout=deadline)
+
+    results = {}
+    for name, future in futures.items():
+        if future in not_done:
+            future.cancel()  # ? A search that already started finishes in the background
+            print(f"The {name} search missed the {deadline}s deadline")
+            results[name] = defaults[name]
+            continue
+        try:
+            results[name] = future.result()
+            print(f"Got the {name} results")
+        except Exception as e:
+            print(e)
+            results[name] = defaults[name]
+
+    body, markdown_placeholder, related_questions = results["web"]
+    img_links = results["images"]
+    video_links = results["videos"]
+    maps_search_results = results["maps"]
+
+    yt_links = None
+    if video_links:
+        yt_links = filter_links(" ".join(video_links))
+
     return (
         body,
         img_links,
@@ -0,0 +1,114 @@
+import re
+import hashlib
+import logging
+import threading
+import weakref
+
+import httpx
+from groq import Groq
+
+from utils.rate_limits import get_router
+
+# Shared by every session of the app process that uses the same API key
+_CLIENTS = {}
+_LOCK = threading.Lock()
+_MODEL_FIELD = re.compile(rb'"model":\s*"([^"]+)"')
+
+CONNECTION_STATS = {
+    "clients_created": 0,
+    "client_cache_hits": 0,
+    "requests": 0,
+    "new_connections": 0,
+    "reused_connections": 0,
+}
+
+
+def _make_http_client(api_key: str) -> httpx.Client:
+    """
+    Creates an HTTP client with a keep-alive connection pool for the Groq API.
+
+    Response hooks count whether each request went over a fresh or a reused
+    connection (the network stream of a pooled connection outlives the request)
+    and feed the rate limit headers into the model router of the API key.
+
+    Args:
+        api_key (str): The API key for Groq API.
+
+    Returns:
+        httpx.Client: The pooled HTTP client.
+    """
+    seen_streams = weakref.WeakSet()
+
+    def count_connection(response: httpx.Response) -> None:
+        stream = response.extensions.get("network_stream")
+        with _LOCK:
+            CONNECTION_STATS["requests"] += 1
+            if stream is None:
+                return
+            if stream in seen_streams:
+                CONNECTION_STATS["reused_connections"] += 1
+            else:
+                seen_streams.add(stream)
+                CONNECTION_STATS["new_connections"] += 1
+
+    def track_rate_limits(response: httpx.Response) -> None:
+        is_throttled = response.status_code == 429
+        if not is_throttled and "x-ratelimit-remaining-tokens" not in response.headers:
+            return
+        try:
+            match = _MODEL_FIELD.search(response.request.content)
+        except httpx.RequestNotRead:
+            return
+        if match:
+            get_router(api_key).update_from_headers(
+                match.group(1).decode(), response.status_code, response.headers
+            )
+
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=50,
+            max_keepalive_connections=20,
+            keepalive_expiry=120,  # ? Keep idle connections open between chat turns
+        ),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+        event_hooks={"response": [count_connection, track_rate_limits]},
+    )
+
+
+def get_groq_client(api_key: str) -> Groq:
+    """
+    Returns the pooled Groq client for the given API key, creating it on first use.
+
+    Args:
+        api_key (str): The API key for Groq API.
+
+    Returns:
+        Groq: The Groq client shared by all callers using the same API key.
+    """
+    key = hashlib.sha256((api_key or "").encode()).hexdigest()
+    with _LOCK:
+        client = _CLIENTS.get(key)
+        if client is not None:
+            CONNECTION_STATS["client_cache_hits"] += 1
+            return client
+
+        client = Groq(api_key=api_key, http_client=_make_http_client(api_key))
+        _CLIENTS[key] = client
+        CONNECTION_STATS["clients_created"] += 1
+
+    logging.info(f"Created pooled Groq client ({len(_CLIENTS)} cached)")
+    return client
+
+
+def get_connection_stats() -> dict:
+    """
+    Returns a snapshot of the connection reuse counters.
+
+    Returns:
+        dict: The counters along with the ratio of requests served over reused connections.
+    """
+    with _LOCK:
+        stats = dict(CONNECTION_STATS)
+    observed = stats["new_connections"] + stats["reused_connections"]
+    stats["reuse_ratio"] = stats["reused_connections"] / observed if observed else 0.0
+    return stats
@@ -0,0 +1,90 @@
+import os
+import re
+import logging
+
+from bs4 import BeautifulSoup
+
+# ? The fast parsers are optional, BeautifulSoup is the fallback
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+    import lxml.etree
+except ImportError:
+    lxml = None
+
+# Paragraphs with this many words or fewer are navigation, captions, etc.
+MIN_PARAGRAPH_WORDS = 10
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def clean_paragraph(text: str) -> str:
+    """Collapses all the whitespace of a paragraph into single spaces."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _paragraphs_with_selectolax(html: str) -> list:
+    tree = LexborHTMLParser(html)
+    return [node.text(deep=True) for node in tree.css("p")]
+
+
+def _paragraphs_with_lxml(html: str) -> list:
+    try:
+        tree = lxml.html.fromstring(html)
+    except lxml.etree.ParserError:
+        return []  # ? Documents without any element
+    return [p.text_content() for p in tree.iter("p")]
+
+
+def _paragraphs_with_bs4(html: str) -> list:
+    soup = BeautifulSoup(html, "html.parser")
+    return [p.get_text() for p in soup.find_all("p")]
+
+
+# Available backends, fastest first
+EXTRACTORS = {}
+if LexborHTMLParser is not None:
+    EXTRACTORS["selectolax"] = _paragraphs_with_selectolax
+if lxml is not None:
+    EXTRACTORS["lxml"] = _paragraphs_with_lxml
+EXTRACTORS["bs4"] = _paragraphs_with_bs4
+
+# Can be pinned with the FAST_CHAT_HTML_EXTRACTOR environment variable
+DEFAULT_EXTRACTOR = os.environ.get("FAST_CHAT_HTML_EXTRACTOR") or next(iter(EXTRACTORS))
+if DEFAULT_EXTRACTOR not in EXTRACTORS:
+    logging.warning(f"HTML extractor {DEFAULT_EXTRACTOR} unavailable, using bs4")
+    DEFAULT_EXTRACTOR = "bs4"
+
+
+def extract_paragraphs(html: str, backend: str = None) -> list:
+    """
+    Extracts the cleaned text of all the substantial <p> tags of a page.
+
+    Args:
+        html (str): The HTML content to parse.
+        backend (str, optional): One of `EXTRACTORS`. Defaults to the fastest available one.
+
+    Returns:
+        list: The text of the <p> tags with more than `MIN_PARAGRAPH_WORDS` words.
+    """
+    if not html:
+        return []
+    backend = backend or DEFAULT_EXTRACTOR
+    try:
+        texts = EXTRACTORS[backend](html)
+    except ValueError as e:
+        if backend == "bs4":
+            raise
+        # ? e.g. lxml refuses strings that still carry an <?xml encoding?> declaration
+        logging.warning(f"The {backend} extractor failed ({e}), falling back to bs4")
+        texts = _paragraphs_with_bs4(html)
+    paragraphs = []
+    for text in texts:
+        cleaned = clean_paragraph(text)
+        if cleaned.count(" ") >= MIN_PARAGRAPH_WORDS:
+            paragraphs.append(cleaned)
+    return paragraphs
@@ -0,0 +1,44 @@
+from utils.cache import TwoTierCache
+
+# How long a crawled page is used without asking the server again (seconds)
+PAGE_TTL = 6 * 3600
+# How long a page is kept for conditional requests once it is no longer fresh
+PAGE_REVALIDATE_TTL = 7 * 24 * 3600
+
+PAGE_CACHE = TwoTierCache(
+    "page_paragraphs",
+    ttl=PAGE_TTL + PAGE_REVALIDATE_TTL,
+    max_items=512,
+    max_bytes=200 * 1024 * 1024,
+)
+
+
+def get_cached_page(url: str):
+    """
+    Looks up the cleaned paragraphs of a previously crawled page.
+
+    Args:
+        url (str): The URL of the page.
+
+    Returns:
+        tuple: (paragraphs, validators, fresh), or None on a miss. `validators`
+        holds the `ETag`/`Last-Modified` headers of the page, and `fresh` tells
+        whether the page can be used without revalidating it.
+    """
+    entry = PAGE_CACHE.get_entry(url)
+    if entry is None:
+        return None
+    value, age = entry
+    return value["paragraphs"], value["validators"], age <= PAGE_TTL
+
+
+def cache_page(url: str, paragraphs: list, validators: dict = None) -> None:
+    """
+    Stores the cleaned paragraphs of a crawled page (the raw HTML is not kept).
+
+    Args:
+        url (str): The URL of the page.
+        paragraphs (list): All the paragraphs extracted from the page.
+        validators (dict, optional): The `ETag`/`Last-Modified` headers of the response.
+    """
+    PAGE_CACHE.set(url, {"paragraphs": paragraphs, "validators": validators or {}})
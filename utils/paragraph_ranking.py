@@ -0,0 +1,153 @@
+import re
+
+import numpy as np
+
+from utils.text import STOPWORDS
+from utils.tokens import estimate_tokens
+
+# Paragraphs kept per page, and the token budget of all the pages of a search
+PARAGRAPHS_PER_PAGE = 5
+DEFAULT_TOKEN_BUDGET = 4000
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD = re.compile(r"\w+")
+
+
+def _terms(text: str) -> list:
+    """Splits the text into lowercase words, with a naive plural stemmer."""
+    return [
+        word[:-1] if len(word) > 3 and word[-1] == "s" and word[-2] != "s" else word
+        for word in _WORD.findall(text.lower())
+    ]
+
+
+def bm25_scores(query: str, paragraphs: list) -> np.ndarray:
+    """
+    Scores paragraphs against a query with Okapi BM25.
+
+    Only the query terms matter to BM25, so every paragraph is reduced to the
+    counts of those terms and the scoring is a handful of NumPy operations over
+    a (paragraphs x query terms) matrix.
+
+    Args:
+        query (str): The user query.
+        paragraphs (list): The paragraphs to score (they are also the corpus the IDF is taken from).
+
+    Returns:
+        np.ndarray: The score of every paragraph (all zeros if the query has no content words).
+    """
+    query_terms = list(
+        dict.fromkeys(term for term in _terms(query) if term not in STOPWORDS)
+    )
+    if not paragraphs or not query_terms:
+        return np.zeros(len(paragraphs))
+
+    columns = {term: column for column, term in enumerate(query_terms)}
+    frequencies = np.zeros((len(paragraphs), len(query_terms)))
+    lengths = np.empty(len(paragraphs))
+    for row, paragraph in enumerate(paragraphs):
+        terms = _terms(paragraph)
+        lengths[row] = len(terms)
+        for term in terms:
+            column = columns.get(term)
+            if column is not None:
+                frequencies[row, column] += 1
+
+    document_frequency = np.count_nonzero(frequencies, axis=0)
+    idf = np.log1p(
+        (len(paragraphs) - document_frequency + 0.5) / (document_frequency + 0.5)
+    )
+    norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1.0))
+    saturated = frequencies * (BM25_K1 + 1) / (frequencies + norms[:, None])
+    return saturated @ idf
+
+
+def rank_paragraphs(
+    query: str,
+    page_paragraphs: list,
+    per_page: int = PARAGRAPHS_PER_PAGE,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> list:
+    """
+    Keeps the paragraphs of each page that are most relevant to the query.
+
+    All the paragraphs are scored together, so rare query terms weigh the same on
+    every page. The top `per_page` paragraphs of each page are candidates, and the
+    best candidates across pages are kept while they fit the token budget (ties go
+    to earlier pages, i.e. better search results, and to earlier paragraphs).
+
+    Args:
+        query (str): The user query.
+        page_paragraphs (list): The paragraphs of each page (None or [] for pages without any).
+        per_page (int): The most paragraphs kept from a single page.
+        token_budget (int, optional): The most tokens kept overall (None for no limit).
+
+    Returns:
+        list: The kept paragraphs of each page, in their original order.
+    """
+    flat = [
+        (page, position, paragraph)
+        for page, paragraphs in enumerate(page_paragraphs)
+        for position, paragraph in enumerate(paragraphs or [])
+    ]
+    kept = [[] for _ in page_paragraphs]
+    if not flat:
+        return kept
+
+    scores = bm25_scores(query, [paragraph for _, _, paragraph in flat])
+    pages = np.array([page for page, _, _ in flat])
+    positions = np.array([position for _, position, _ in flat])
+
+    # Best first: highest score, then earliest page, then earliest paragraph
+    order = np.lexsort((positions, pages, -scores))
+    # The rank of each paragraph within its page, in that order
+    page_ranks = np.zeros(len(flat), dtype=np.int64)
+    seen = np.zeros(len(page_paragraphs), dtype=np.int64)
+    for index in order:
+        page_ranks[index] = seen[pages[index]]
+        seen[pages[index]] += 1
+
+    budget = float("inf") if token_budget is None else token_budget
+    chosen = []
+    for index in order:
+        if page_ranks[index] >= per_page:
+            continue
+        tokens = estimate_tokens(flat[index][2])
+        if tokens > budget:
+            continue  # ? A shorter paragraph further down may still fit
+        budget -= tokens
+        chosen.append(index)
+
+    for index in sorted(chosen):
+        page, _, paragraph = flat[index]
+        kept[page].append(paragraph)
+    return kept
+
+
+def sort_by_relevance(query: str, page_paragraphs: list) -> list:
+    """
+    Orders the paragraphs of each page from the most to the least relevant to the query.
+
+    Args:
+        query (str): The user query.
+        page_paragraphs (list): The paragraphs of each page (None or [] for pages without any).
+
+    Returns:
+        list: The paragraphs of each page, most relevant first (earlier ones first on ties).
+    """
+    flat = [
+        paragraph for paragraphs in page_paragraphs for paragraph in paragraphs or []
+    ]
+    scores = bm25_scores(query, flat)
+
+    ordered, start = [], 0
+    for paragraphs in page_paragraphs:
+        count = len(paragraphs or [])
+        # ? A stable sort keeps the page order among equally relevant paragraphs
+        order = np.argsort(-scores[start : start + count], kind="stable")
+        ordered.append([paragraphs[index] for index in order])
+        start += count
+    return ordered
@@ -0,0 +1,80 @@
+import re
+from collections import deque
+
+from utils.tokens import estimate_tokens
+
+# Tokens taken by the <result n> tags wrapping the passages of a source
+SOURCE_TAG_TOKENS = 12
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def fit_sentences(passage: str, token_budget: int) -> tuple:
+    """
+    Returns the leading whole sentences of a passage that fit the budget.
+
+    Args:
+        passage (str): The passage to shorten.
+        token_budget (int): The tokens available.
+
+    Returns:
+        tuple: The shortened passage ("" if not even its first sentence fits) and its tokens.
+    """
+    kept, used = [], 0
+    for sentence in _SENTENCE_END.split(passage):
+        tokens = estimate_tokens(sentence)
+        if used + tokens > token_budget:
+            break
+        kept.append(sentence)
+        used += tokens
+    return " ".join(kept), used
+
+
+def pack_passages(source_passages: list, token_budget: int) -> tuple:
+    """
+    Fills a token budget with the passages of several sources, taking turns between them.
+
+    Sources are visited round-robin (in the order given, i.e. search rank), each
+    giving up its next most relevant passage, so one long page can't crowd out
+    the others. Passages that don't fit whole are set aside while the sources
+    keep taking turns, then cut at the last sentence that fits whatever budget is
+    left. The budget is counted passage by passage, never by re-measuring the
+    whole body.
+
+    Args:
+        source_passages (list): The passages of each source, most relevant first.
+        token_budget (int): The tokens available, including `SOURCE_TAG_TOKENS` per used source.
+
+    Returns:
+        tuple: The packed passages of each source, and the tokens they take.
+    """
+    queues = [deque(passages or []) for passages in source_passages]
+    packed = [[] for _ in source_passages]
+    set_aside = []
+    remaining = token_budget
+
+    def take(source, passage, tokens):
+        nonlocal remaining
+        packed[source].append(passage)
+        remaining -= tokens + (SOURCE_TAG_TOKENS if len(packed[source]) == 1 else 0)
+
+    while remaining > 0 and any(queues):
+        for source, queue in enumerate(queues):
+            if not queue:
+                continue
+            passage = queue.popleft()
+            overhead = 0 if packed[source] else SOURCE_TAG_TOKENS
+            tokens = estimate_tokens(passage)
+            if tokens + overhead <= remaining:
+                take(source, passage, tokens)
+            else:
+                set_aside.append((source, passage))
+
+    # ? Whole sentences of the passages that were too long fill what is left
+    for source, passage in set_aside:
+        overhead = 0 if packed[source] else SOURCE_TAG_TOKENS
+        passage, tokens = fit_sentences(passage, remaining - overhead)
+        if passage:
+            take(source, passage, tokens)
+
+    return packed, token_budget - remaining
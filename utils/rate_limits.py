@@ -0,0 +1,449 @@
+import re
+import time
+import hashlib
+import logging
+import threading
+
+from utils.tokens import context_window
+
+# Conservative free tier limits used until Groq reports the real ones in its headers
+# (requests per minute, tokens per minute)
+DEFAULT_RATE_LIMITS = {
+    "gemma2-9b-it": (30, 15000),
+    "llama-3.1-8b-instant": (30, 6000),
+    "llama-3.3-70b-versatile": (30, 12000),
+    "meta-llama/llama-4-maverick-17b-128e-instruct": (30, 6000),
+    "meta-llama/llama-4-scout-17b-16e-instruct": (30, 30000),
+    "openai/gpt-oss-120b": (30, 8000),
+    "openai/gpt-oss-20b": (30, 8000),
+    "deepseek-r1-distill-llama-70b": (30, 6000),
+    "qwen/qwen3-32b": (60, 6000),
+    "moonshotai/kimi-k2-instruct": (60, 10000),
+}
+FALLBACK_RATE_LIMIT = (30, 6000)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parses a Groq reset duration such as "7.66s", "2m59.56s" or "120ms" into seconds.
+
+    Args:
+        value (str): The header value.
+
+    Returns:
+        float: The duration in seconds (0.0 if it cannot be parsed).
+    """
+    if not value:
+        return 0.0
+    try:
+        return float(value)  # ? `retry-after` is sent as plain seconds
+    except ValueError:
+        pass
+    return sum(
+        float(amount) * _DURATION_UNITS[unit]
+        for amount, unit in _DURATION_PART.findall(value)
+    )
+
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously and can be re-synced from server reports.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated_at) * self.refill_per_second,
+        )
+        self.updated_at = now
+
+    def available(self) -> float:
+        """The amount currently available in the bucket."""
+        self._refill()
+        return self.tokens
+
+    def headroom(self, amount: float = 0) -> float:
+        """The fraction of the bucket left after taking `amount` out of it."""
+        return (self.available() - amount) / self.capacity if self.capacity else 0.0
+
+    def consume(self, amount: float) -> None:
+        """Takes `amount` out of the bucket (it may go negative until refilled)."""
+        self._refill()
+        self.tokens -= amount
+
+    def seconds_until(self, amount: float) -> float:
+        """Seconds until `amount` is available (0.0 if it already is)."""
+        missing = min(amount, self.capacity) - self.available()
+        if missing <= 0:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return float("inf")
+        return missing / self.refill_per_second
+
+    def sync(self, limit: float, remaining: float, reset_seconds: float) -> None:
+        """
+        Aligns the bucket with the limit, remaining budget and reset time reported by the server.
+        """
+        self.capacity = float(limit)
+        self.tokens = float(remaining)
+        self.updated_at = time.monotonic()
+        if reset_seconds > 0 and limit > remaining:
+            self.refill_per_second = (limit - remaining) / reset_seconds
+
+
+class ModelRateLimits:
+    """
+    The request and token buckets of a single model along with any 429 back-off.
+
+    Groq reports its request limit per day and its token limit per minute, so the
+    per-minute request bucket keeps its default size and the reported request
+    limit goes into a separate daily bucket.
+    """
+
+    def __init__(self, model: str):
+        requests_per_minute, tokens_per_minute = DEFAULT_RATE_LIMITS.get(
+            model, FALLBACK_RATE_LIMIT
+        )
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.daily_requests = None  # ? Unknown until Groq reports it
+        self.blocked_until = 0.0
+        self.throttled = 0
+
+    def retry_in(self) -> float:
+        """Seconds left on a `retry-after` received for this model."""
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    def headroom(self, tokens_needed: int) -> float:
+        """The smaller of the request and token headroom left after this request."""
+        if self.retry_in() > 0:
+            return -1.0
+        headroom = min(self.requests.headroom(1), self.tokens.headroom(tokens_needed))
+        if self.daily_requests is not None:
+            headroom = min(headroom, self.daily_requests.headroom(1))
+        return headroom
+
+    def seconds_until(self, tokens_needed: int) -> float:
+        """Seconds until a request of `tokens_needed` tokens fits the budget."""
+        return max(
+            self.retry_in(),
+            self.requests.seconds_until(1),
+            self.tokens.seconds_until(tokens_needed),
+            self.daily_requests.seconds_until(1) if self.daily_requests else 0.0,
+        )
+
+    def max_request_tokens(self) -> int:
+        """The largest request (prompt and response) the model accepts: its context or its tokens per minute."""
+        return int(min(context_window(self.model), self.tokens.capacity))
+
+    def consume(self, tokens_needed: int) -> None:
+        """Takes a request of `tokens_needed` tokens out of the buckets."""
+        self.requests.consume(1)
+        self.tokens.consume(min(tokens_needed, self.tokens.capacity))
+        if self.daily_requests is not None:
+            self.daily_requests.consume(1)
+
+
+class ModelRouter:
+    """
+    Tracks the rate limit budget of every model used with one API key and routes
+    requests to the model with the most headroom.
+    """
+
+    def __init__(self):
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    def _limits_locked(self, model: str) -> ModelRateLimits:
+        if model not in self._limits:
+            self._limits[model] = ModelRateLimits(model)
+        return self._limits[model]
+
+    def limits(self, model: str) -> ModelRateLimits:
+        """Returns the rate limit state of the model, creating it on first use."""
+        with self._lock:
+            return self._limits_locked(model)
+
+    def _reserve_locked(self, limits: ModelRateLimits, tokens: int) -> float:
+        """Reserves the budget of a request if it is available, else returns the seconds to wait."""
+        delay = limits.seconds_until(tokens)
+        if delay <= 0:
+            limits.consume(tokens)
+        return max(0.0, delay)
+
+    def update_from_headers(self, model: str, status_code: int, headers) -> None:
+        """
+        Feeds the `x-ratelimit-*` and `retry-after` headers of a Groq response into the buckets.
+
+        Args:
+            model (str): The model the request was sent to.
+            status_code (int): The HTTP status of the response.
+            headers (Mapping): The response headers.
+        """
+        limits = self.limits(model)
+        with self._lock:
+            for kind in ("requests", "tokens"):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if limit is None or remaining is None:
+                    continue
+                try:
+                    limit, remaining = float(limit), float(remaining)
+                except ValueError:
+                    continue
+                if kind == "tokens":
+                    bucket = limits.tokens
+                else:  # ? Requests per day, not per minute
+                    if limits.daily_requests is None:
+                        limits.daily_requests = TokenBucket(limit, limit / 86400)
+                    bucket = limits.daily_requests
+                bucket.sync(
+                    limit,
+                    remaining,
+                    parse_duration(headers.get(f"x-ratelimit-reset-{kind}")),
+                )
+
+            if status_code == 429:
+                retry_after = parse_duration(headers.get("retry-after")) or 1.0
+                limits.blocked_until = max(
+                    limits.blocked_until, time.monotonic() + retry_after
+                )
+                limits.throttled += 1
+                logging.warning(f"{model} is rate limited for {retry_after:.2f}s")
+
+    def max_request_tokens(self, model: str) -> int:
+        """The largest request (prompt and response) the model accepts, see `ModelRateLimits`."""
+        with self._lock:
+            return self._limits_locked(model).max_request_tokens()
+
+    def pick(
+        self,
+        candidates: list,
+        prompt_tokens: int = 0,
+        reserve_tokens: int = 0,
+        acquire: bool = False,
+        splittable: bool = False,
+    ):
+        """
+        Picks the model with the most rate limit headroom that accepts the whole request.
+
+        A request fits a model if it fits both its context and its tokens per minute
+        (Groq rejects larger requests outright). Callers that split their prompt into
+        requests sized for the model may also get a model that doesn't fit it whole,
+        rather than waiting on the budget of the ones that do.
+
+        Args:
+            candidates (list): The (model, max_tokens) pairs to choose from.
+            prompt_tokens (int): The estimated size of the prompt.
+            reserve_tokens (int): Tokens to keep free in the context for the response.
+            acquire (bool): Also reserves the budget of the (first) request on the chosen
+                model, waiting for it if needed, as `acquire` would.
+            splittable (bool): Whether the caller splits a prompt too large for the model.
+
+        Returns:
+            tuple: The chosen (model, max_tokens) pair.
+        """
+        # ? Score, choose and reserve under one lock, so concurrent callers don't all
+        # ? pick the same model on the strength of the same headroom
+        with self._lock:
+            limits = {
+                candidate[0]: self._limits_locked(candidate[0])
+                for candidate in candidates
+            }
+            # The part of the prompt a single request to each model carries
+            request_tokens = {
+                model: min(prompt_tokens, model_limits.max_request_tokens())
+                for model, model_limits in limits.items()
+            }
+            scores = {
+                model: model_limits.headroom(request_tokens[model])
+                for model, model_limits in limits.items()
+            }
+
+            fitting = [
+                candidate
+                for candidate in candidates
+                if prompt_tokens + reserve_tokens
+                <= limits[candidate[0]].max_request_tokens()
+            ]
+            ready = [
+                candidate
+                for candidate in (candidates if splittable else fitting)
+                if scores[candidate[0]] >= 0
+            ]
+            if ready:
+                # ? Fitting models first, then the most headroom, then the largest requests
+                chosen = max(
+                    ready,
+                    key=lambda candidate: (
+                        candidate in fitting,
+                        scores[candidate[0]],
+                        limits[candidate[0]].max_request_tokens(),
+                    ),
+                )
+            elif fitting:
+                # ? Every fitting model is exhausted, take the one that recovers first
+                chosen = min(
+                    fitting,
+                    key=lambda candidate: limits[candidate[0]].seconds_until(
+                        request_tokens[candidate[0]]
+                    ),
+                )
+            else:  # ? Nothing fits, fall back to the largest requests available
+                chosen = max(
+                    candidates,
+                    key=lambda candidate: limits[candidate[0]].max_request_tokens(),
+                )
+
+            delay = 0.0
+            if acquire:
+                delay = self._reserve_locked(
+                    limits[chosen[0]], request_tokens[chosen[0]]
+                )
+
+        logging.info(
+            f"Routed {prompt_tokens} prompt tokens to {chosen[0]} "
+            f"(headroom {scores[chosen[0]]:.2f}; "
+            + ", ".join(f"{model}={score:.2f}" for model, score in scores.items())
+            + f"; {len(candidates) - len(fitting)} too small for the whole request)"
+        )
+        if delay > 0:
+            self.acquire(chosen[0], request_tokens[chosen[0]])
+        return chosen
+
+    def acquire(self, model: str, tokens: int, max_wait: float = 60.0) -> float:
+        """
+        Waits until the model has budget for the request, then reserves it.
+
+        Returns immediately when the budget is already available, so requests are
+        only delayed by what the rate limit headers and `retry-after` values require.
+
+        Args:
+            model (str): The model the request is sent to.
+            tokens (int): The estimated size of the request.
+            max_wait (float): The longest wait allowed (Groq retries 429s on its own beyond that).
+
+        Returns:
+            float: The number of seconds waited.
+        """
+        limits = self.limits(model)
+        waited = 0.0
+        while True:
+            # ? Check and reserve atomically, so concurrent callers can't share the same budget
+            with self._lock:
+                if waited >= max_wait:
+                    limits.consume(tokens)
+                    return waited
+                delay = min(self._reserve_locked(limits, tokens), max_wait - waited)
+                if delay <= 0:
+                    return waited
+            logging.info(f"Waiting {delay:.2f}s for the rate limit budget of {model}")
+            time.sleep(delay)
+            waited += delay
+
+
+_ROUTERS = {}
+_ROUTERS_LOCK = threading.Lock()
+
+
+def get_router(api_key: str) -> ModelRouter:
+    """
+    Returns the model router tracking the rate limits of the given API key.
+
+    Args:
+        api_key (str): The API key for Groq API.
+
+    Returns:
+        ModelRouter: The router shared by every caller using the same API key.
+    """
+    key = hashlib.sha256((api_key or "").encode()).hexdigest()
+    with _ROUTERS_LOCK:
+        if key not in _ROUTERS:
+            _ROUTERS[key] = ModelRouter()
+        return _ROUTERS[key]
+
+
+class BackoffPacer:
+    """
+    Paces calls to providers that do not report their rate limits (e.g. DuckDuckGo).
+
+    No delay is applied while calls succeed. Each observed failure (rate limit or
+    timeout) pushes the next call back exponentially, or by the `retry-after` the
+    provider asked for, and a success resets the back-off.
+    """
+
+    def __init__(self, base_delay: float = 1.0, factor: float = 2.0, max_delay=30.0):
+        self.base_delay = base_delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self._failures = {}
+        self._ready_at = {}
+        self._lock = threading.Lock()
+
+    def delay(self, key: str) -> float:
+        """Seconds until the provider can be called again."""
+        with self._lock:
+            return max(0.0, self._ready_at.get(key, 0.0) - time.monotonic())
+
+    def wait(self, key: str) -> float:
+        """
+        Sleeps until the provider can be called again.
+
+        Args:
+            key (str): The provider name.
+
+        Returns:
+            float: The number of seconds waited.
+        """
+        delay = self.delay(key)
+        if delay > 0:
+            logging.info(f"Backing off {key} for {delay:.2f}s")
+            time.sleep(delay)
+        return delay
+
+    def record_success(self, key: str) -> None:
+        """Resets the back-off of the provider."""
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def record_failure(
+        self, key: str, retry_after: float = None, base_delay=None, factor=None
+    ) -> float:
+        """
+        Pushes the next call to the provider back.
+
+        Args:
+            key (str): The provider name.
+            retry_after (float, optional): The delay requested by the provider, if any.
+            base_delay (float, optional): Overrides the delay after the first failure.
+            factor (float, optional): Overrides the growth of the delay per failure.
+
+        Returns:
+            float: The delay applied.
+        """
+        base_delay = self.base_delay if base_delay is None else base_delay
+        factor = self.factor if factor is None else factor
+        with self._lock:
+            failures = self._failures.get(key, 0) + 1
+            self._failures[key] = failures
+            delay = retry_after or base_delay * factor ** (failures - 1)
+            delay = min(delay, self.max_delay)
+            self._ready_at[key] = max(
+                self._ready_at.get(key, 0.0), time.monotonic() + delay
+            )
+        return delay
+
+
+# Shared by all the web search providers of the app
+SEARCH_PACER = BackoffPacer()
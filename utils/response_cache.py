@@ -0,0 +1,109 @@
+import json
+import hashlib
+
+from utils.cache import TwoTierCache
+
+RESPONSE_CACHE = TwoTierCache("chat_responses", ttl=24 * 3600, max_items=256)
+
+
+def _normalize_message(message: dict) -> dict:
+    content = message.get("content")
+    if isinstance(content, str):
+        content = " ".join(content.split())
+    return {"role": message.get("role", "").lower(), "content": content}
+
+
+def is_cacheable(temperature: float, seed: int = None, live_data: bool = False) -> bool:
+    """
+    Whether replaying an earlier response gives what a new request would.
+
+    Sampled responses (temperature above 0 without a fixed seed) are meant to vary,
+    and responses built on live data (search results, browsing) go stale.
+
+    Args:
+        temperature (float): The sampling temperature.
+        seed (int, optional): The sampling seed, if fixed.
+        live_data (bool): Whether the response draws on search results or browsing.
+
+    Returns:
+        bool: True if the response can be cached and replayed.
+    """
+    return not live_data and (temperature == 0 or seed is not None)
+
+
+def response_cache_key(
+    model: str,
+    messages: list,
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    tools: list = None,
+) -> str:
+    """
+    Returns the cache key of a chat completion request.
+
+    Messages are normalized (whitespace collapsed, role lowercased) so trivially
+    different prompts share an entry.
+
+    Args:
+        model (str): The model of the request.
+        messages (list): The messages sent to the model.
+        temperature (float): The sampling temperature.
+        top_p (float): The nucleus sampling probability.
+        max_tokens (int): The maximum tokens of the response.
+        tools (list, optional): The tools made available to the model.
+
+    Returns:
+        str: The SHA-256 hex digest identifying the request.
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": [_normalize_message(message) for message in messages],
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_tokens": max_tokens,
+            "tools": tools or [],
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_cached_response(key: str):
+    """
+    Looks up a previously generated response.
+
+    Args:
+        key (str): The key returned by `response_cache_key`.
+
+    Returns:
+        tuple: (model_output, final_response, reasoning), or None on a miss.
+    """
+    cached = RESPONSE_CACHE.get(key)
+    if cached is None:
+        return None
+    return cached["model_output"], cached["final_response"], cached["reasoning"]
+
+
+def cache_response(key: str, model_output: str, final_response: str, reasoning: str):
+    """
+    Stores a generated response for identical requests to replay.
+
+    Args:
+        key (str): The key returned by `response_cache_key`.
+        model_output (str): The output kept in the chat history.
+        final_response (str): The response shown to the user.
+        reasoning (str): The reasoning of the model, if any.
+    """
+    if not final_response:
+        return
+    RESPONSE_CACHE.set(
+        key,
+        {
+            "model_output": model_output,
+            "final_response": final_response,
+            "reasoning": reasoning,
+        },
+    )
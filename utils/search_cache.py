@@ -0,0 +1,171 @@
+import json
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.cache import TwoTierCache
+
+# How long the results of each provider are served as fresh (seconds)
+SEARCH_TTLS = {
+    "ddgs_text": 60 * 60,
+    "ddgs_images": 6 * 3600,
+    "serpapi": 6 * 3600,
+    "serpapi_images": 24 * 3600,
+    "serpapi_videos": 24 * 3600,
+    "serpapi_maps": 24 * 3600,
+}
+DEFAULT_SEARCH_TTL = 60 * 60
+# Once fresh results expire they are still served for this share of their TTL while being refreshed
+STALE_FRACTION = 0.5
+# Stale results are no longer served after this many refreshes of them failed in a row
+MAX_REFRESH_FAILURES = 3
+
+SEARCH_CACHE = TwoTierCache(
+    "search_results",
+    ttl=DEFAULT_SEARCH_TTL * (1 + STALE_FRACTION),
+    max_items=512,
+    max_bytes=100 * 1024 * 1024,
+)
+
+_STATS = defaultdict(lambda: {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0})
+_REFRESHING = set()
+_REFRESH_FAILURES = {}
+_LOCK = threading.Lock()
+_REFRESH_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-cache")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercases the query and collapses its whitespace."""
+    return " ".join(str(query or "").lower().split())
+
+
+def search_cache_key(provider: str, query: str, region=None, count=None) -> str:
+    """
+    Returns the cache key of a search.
+
+    Args:
+        provider (str): The search provider (one of `SEARCH_TTLS`).
+        query (str): The search query.
+        region (str, optional): The region, location or locale of the search.
+        count (int, optional): The number of results requested.
+
+    Returns:
+        str: The SHA-256 hex digest identifying the search.
+    """
+    payload = json.dumps([provider, normalize_query(query), region, count], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def stale_window(provider: str) -> float:
+    """The seconds the results of the provider are still served once past their TTL."""
+    return SEARCH_TTLS.get(provider, DEFAULT_SEARCH_TTL) * STALE_FRACTION
+
+
+def _store(provider: str, key: str, value, is_valid) -> bool:
+    if not is_valid(value):
+        return False
+    ttl = SEARCH_TTLS.get(provider, DEFAULT_SEARCH_TTL)
+    SEARCH_CACHE.set(key, value, ttl=ttl + stale_window(provider))
+    with _LOCK:
+        _REFRESH_FAILURES.pop(key, None)
+    return True
+
+
+def _refresh(provider: str, key: str, fetch, is_valid) -> None:
+    stored = False
+    try:
+        stored = _store(provider, key, fetch(), is_valid)
+    except Exception as e:
+        logging.error(f"Background refresh of a {provider} search failed: {e}")
+    finally:
+        with _LOCK:
+            _REFRESHING.discard(key)
+            if not stored:
+                _REFRESH_FAILURES[key] = _REFRESH_FAILURES.get(key, 0) + 1
+
+
+def cached_search(
+    provider: str,
+    query: str,
+    fetch,
+    region=None,
+    count=None,
+    is_valid=bool,
+):
+    """
+    Returns the results of a search from the shared cache, running it on a miss.
+
+    Fresh results are returned as is. Results past their TTL are still returned
+    (stale-while-revalidate) for `STALE_FRACTION` of the TTL while a background
+    refresh replaces them, unless the last `MAX_REFRESH_FAILURES` refreshes
+    failed, in which case the search runs again in the foreground. Failed or
+    empty searches are never cached.
+
+    Args:
+        provider (str): The search provider (one of `SEARCH_TTLS`).
+        query (str): The search query.
+        fetch (callable): Runs the search and returns JSON serializable results.
+        region (str, optional): The region, location or locale of the search.
+        count (int, optional): The number of results requested.
+        is_valid (callable): Decides whether results are worth caching.
+
+    Returns:
+        The search results.
+    """
+    key = search_cache_key(provider, query, region, count)
+    entry = SEARCH_CACHE.get_entry(key)
+
+    if entry is not None:
+        value, age = entry
+        ttl = SEARCH_TTLS.get(provider, DEFAULT_SEARCH_TTL)
+        if age <= ttl:
+            with _LOCK:
+                _STATS[provider]["hits"] += 1
+            return value
+
+        with _LOCK:
+            failing = _REFRESH_FAILURES.get(key, 0) >= MAX_REFRESH_FAILURES
+        if age > ttl + stale_window(provider):
+            entry = None  # ? Stored with a longer stale window than the current one
+        elif failing:
+            logging.warning(
+                f"Not serving the stale {provider} results of {query!r}, "
+                f"their last {MAX_REFRESH_FAILURES} refreshes failed"
+            )
+            entry = None
+
+    if entry is not None:
+        with _LOCK:
+            _STATS[provider]["stale_hits"] += 1
+            refresh = key not in _REFRESHING
+            if refresh:
+                _REFRESHING.add(key)
+                _STATS[provider]["refreshes"] += 1
+        if refresh:
+            logging.info(f"Refreshing the stale {provider} results of {query!r}")
+            _REFRESH_EXECUTOR.submit(_refresh, provider, key, fetch, is_valid)
+        return value
+
+    with _LOCK:
+        _STATS[provider]["misses"] += 1
+    value = fetch()
+    _store(provider, key, value, is_valid)
+    return value
+
+
+def get_search_cache_stats() -> dict:
+    """
+    Returns the hit and miss counters of every provider along with their hit rate.
+
+    Returns:
+        dict: The counters keyed by provider.
+    """
+    with _LOCK:
+        stats = {provider: dict(counters) for provider, counters in _STATS.items()}
+    for counters in stats.values():
+        hits = counters["hits"] + counters["stale_hits"]
+        total = hits + counters["misses"]
+        counters["hit_rate"] = hits / total if total else 0.0
+    return stats
@@ -0,0 +1,231 @@
+import re
+import time
+import zlib
+import logging
+import threading
+from collections import Counter
+
+import numpy as np
+
+from utils.text import STOPWORDS
+
+N_FEATURES = 2**12
+
+# Search backed answers go stale faster than plain chat answers (seconds)
+MODE_TTLS = {
+    "chat": 24 * 3600,
+    "compound": 30 * 60,
+    "duckduckgo": 30 * 60,
+    "serp": 30 * 60,
+    "agentic": 60 * 60,
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Words that give the direction between their neighbours ("usd to inr")
+_DIRECTIONAL = frozenset("to from into than vs versus".split())
+_ARROW = "->"
+
+# "Now" is implied by the TTL of the mode, so "kolkata weather now" and "weather in kolkata today" match
+_NOW_WORDS = frozenset("now today current currently latest presently".split())
+
+
+def _words(text: str) -> list:
+    """
+    The content words of the text, in order, with a naive plural stemmer.
+
+    Directional words are kept as an arrow between the words they connect.
+    """
+    words = []
+    for word in _WORD.findall(text.lower()):
+        if word in _DIRECTIONAL:
+            words.append(_ARROW)
+            continue
+        if word in STOPWORDS or word in _NOW_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def _features(words: list) -> Counter:
+    """
+    Hashes the content words and their bigrams into feature counts.
+
+    Bigrams ignore the word order ("kolkata weather" is "weather in kolkata"),
+    except across a directional word, so "delhi to mumbai" and "mumbai to delhi"
+    (or "usd to inr" and "inr to usd") don't look like the same question.
+    """
+    terms = [word for word in words if word != _ARROW]
+    previous, directed = None, False
+    for word in words:
+        if word == _ARROW:
+            directed = True
+            continue
+        if previous:
+            terms.append(
+                f"{previous} {_ARROW} {word}"
+                if directed
+                else " ".join(sorted((previous, word)))
+            )
+        previous, directed = word, False
+    return Counter(zlib.crc32(term.encode()) % N_FEATURES for term in terms)
+
+
+def _numbers(words: list) -> frozenset:
+    """The words with digits, which must match exactly (amounts, years, flight numbers...)."""
+    return frozenset(word for word in words if any(char.isdigit() for char in word))
+
+
+class SemanticCache:
+    """
+    Returns earlier answers to paraphrased questions using hashed TF-IDF vectors.
+
+    Everything runs on the CPU with NumPy: questions are hashed into a fixed size
+    bag of words and word bigrams, weighted by the inverse document frequency of
+    the stored questions and compared by cosine similarity. Questions only match
+    if they mention the same numbers and were asked in the same scope (search
+    location, region and system prompt).
+
+    Attributes:
+        stats (dict): Lookups, hits and the seconds of generation saved by the hits.
+    """
+
+    def __init__(self, threshold: float = 0.85, max_entries: int = 500):
+        """
+        Args:
+            threshold (float): The cosine similarity above which a stored answer is reused.
+            max_entries (int): The number of questions remembered.
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.stats = {"lookups": 0, "hits": 0, "time_saved": 0.0}
+
+        self._entries = []
+        self._document_frequency = np.zeros(N_FEATURES)
+        self._lock = threading.Lock()
+
+    def _vectorize(self, features: Counter, idf: np.ndarray) -> np.ndarray:
+        vector = np.zeros(N_FEATURES)
+        if features:
+            indices = np.fromiter(features.keys(), dtype=np.int64)
+            counts = np.fromiter(features.values(), dtype=np.float64)
+            vector[indices] = 1 + np.log(counts)
+        vector *= idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, keep) -> None:
+        for entry in self._entries:
+            if not keep(entry):
+                self._document_frequency[list(entry["features"])] -= 1
+        self._entries = [entry for entry in self._entries if keep(entry)]
+
+    def lookup(self, question: str, model: str, mode: str, scope: tuple = ()):
+        """
+        Finds the stored answer to the closest question asked with the same model, mode and scope.
+
+        Args:
+            question (str): The user question.
+            model (str): The model that would answer it.
+            mode (str): The search mode (one of `MODE_TTLS`).
+            scope (tuple, optional): Whatever else shapes the answer (search location, region, system prompt).
+
+        Returns:
+            dict: The stored payload, or None if no stored question is similar enough.
+        """
+        words = _words(question)
+        features, numbers = _features(words), _numbers(words)
+        if not features:
+            return None
+
+        now = time.time()
+        with self._lock:
+            self.stats["lookups"] += 1
+            self._drop(lambda entry: entry["expires"] > now)
+            candidates = [
+                entry
+                for entry in self._entries
+                if entry["model"] == model
+                and entry["mode"] == mode
+                and entry["scope"] == scope
+                and entry["numbers"] == numbers
+            ]
+            if not candidates:
+                return None
+
+            idf = np.log((1 + len(self._entries)) / (1 + self._document_frequency)) + 1
+            query = self._vectorize(features, idf)
+            matrix = np.vstack(
+                [self._vectorize(entry["features"], idf) for entry in candidates]
+            )
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            entry = candidates[best]
+            self.stats["hits"] += 1
+            self.stats["time_saved"] += entry["cost"]
+
+        logging.info(
+            f"Semantic cache hit ({similarities[best]:.2f}) for {question!r} "
+            f"~ {entry['question']!r}; hit rate {self.hit_rate():.0%}, "
+            f"{self.stats['time_saved']:.1f}s saved"
+        )
+        return entry["payload"]
+
+    def store(
+        self,
+        question: str,
+        model: str,
+        mode: str,
+        payload: dict,
+        cost: float,
+        scope: tuple = (),
+    ) -> None:
+        """
+        Remembers the answer to a question.
+
+        Args:
+            question (str): The user question.
+            model (str): The model that answered it.
+            mode (str): The search mode (one of `MODE_TTLS`).
+            payload (dict): The answer and media to replay.
+            cost (float): The seconds it took to produce the answer.
+            scope (tuple, optional): Whatever else shaped the answer (search location, region, system prompt).
+        """
+        words = _words(question)
+        features = _features(words)
+        if not features:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._entries.append(
+                {
+                    "question": question,
+                    "features": features,
+                    "model": model,
+                    "mode": mode,
+                    "scope": scope,
+                    "numbers": _numbers(words),
+                    "payload": payload,
+                    "cost": cost,
+                    "expires": now + MODE_TTLS.get(mode, MODE_TTLS["chat"]),
+                }
+            )
+            self._document_frequency[list(features)] += 1
+            if len(self._entries) > self.max_entries:
+                oldest = self._entries[0]
+                self._drop(lambda entry: entry is not oldest)
+
+    def hit_rate(self) -> float:
+        """The share of lookups answered from the cache."""
+        lookups = self.stats["lookups"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+
+# Shared by every session of the app process
+SEMANTIC_CACHE = SemanticCache()
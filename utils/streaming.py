@@ -0,0 +1,412 @@
+import time
+import queue
+import logging
+import threading
+
+# Models that return their chain of thought in a separate `reasoning` field
+REASONING_FIELD_MODELS = ("openai/gpt-oss-20b", "openai/gpt-oss-120b")
+
+# Models that inline their chain of thought within <think>...</think> tags
+THINK_TAG_MODELS = ("deepseek-r1-distill-llama-70b", "qwen/qwen3-32b")
+
+
+class ThinkTagParser:
+    """
+    Incrementally splits the output of <think> models into reasoning and answer.
+
+    Text can be fed in arbitrary chunks (a tag may be split across chunks). Reasoning
+    and answer chunks are routed to separate sinks as soon as they are known, so the
+    answer never waits on a rescan of the whole buffer. Only a possible partial tag
+    is held back between calls.
+
+    Attributes:
+        reasoning (str): The reasoning parsed so far.
+        answer (str): The answer parsed so far.
+        state (str): One of "start", "reasoning" or "answer".
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self, on_reasoning=None, on_answer=None):
+        """
+        Args:
+            on_reasoning (callable, optional): Called with every new reasoning chunk.
+            on_answer (callable, optional): Called with every new answer chunk.
+        """
+        self.on_reasoning = on_reasoning
+        self.on_answer = on_answer
+        self.reasoning = ""
+        self.answer = ""
+        self.state = "start"
+        self._pending = ""
+        self._strip_leading = True
+
+    def _emit(self, text: str, to_answer: bool) -> None:
+        if self._strip_leading:
+            text = text.lstrip()
+            if not text:
+                return
+            self._strip_leading = False
+        if not text:
+            return
+        if to_answer:
+            self.answer += text
+            if self.on_answer is not None:
+                self.on_answer(text)
+        else:
+            self.reasoning += text
+            if self.on_reasoning is not None:
+                self.on_reasoning(text)
+
+    def feed(self, text: str) -> None:
+        """Consume the next chunk of raw model output."""
+        self._pending += text
+
+        while True:
+            if self.state == "start":
+                stripped = self._pending.lstrip()
+                if stripped.startswith(self.OPEN_TAG):
+                    self._pending = stripped[len(self.OPEN_TAG) :]
+                    self.state = "reasoning"
+                elif self.OPEN_TAG.startswith(stripped):
+                    return  # ? Wait until we know whether the output opens with a <think> tag
+                else:
+                    self.state = "answer"
+
+            elif self.state == "reasoning":
+                idx = self._pending.find(self.CLOSE_TAG)
+                if idx != -1:
+                    self._emit(self._pending[:idx], to_answer=False)
+                    self._pending = self._pending[idx + len(self.CLOSE_TAG) :]
+                    self.state = "answer"
+                    self._strip_leading = True
+                    continue
+
+                # ? Hold back the longest suffix that could be the start of </think>
+                keep = 0
+                longest = min(len(self.CLOSE_TAG) - 1, len(self._pending))
+                for size in range(longest, 0, -1):
+                    if self.CLOSE_TAG.startswith(self._pending[-size:]):
+                        keep = size
+                        break
+                cut = len(self._pending) - keep
+                self._emit(self._pending[:cut], to_answer=False)
+                self._pending = self._pending[cut:]
+                return
+
+            else:
+                self._emit(self._pending, to_answer=True)
+                self._pending = ""
+                return
+
+    def close(self) -> None:
+        """Flush whatever is held back once the stream has ended."""
+        if self.state == "start":
+            self.state = "answer"
+        self._emit(self._pending, to_answer=self.state == "answer")
+        self._pending = ""
+        if self.is_unclosed:
+            # ? Reasoning is never promoted to the answer, the answer stays empty
+            logging.warning("The <think> block was never closed, there is no answer")
+
+    @property
+    def is_unclosed(self) -> bool:
+        """Whether the output opened a <think> block that was never closed."""
+        return self.state == "reasoning"
+
+
+def split_think_tags(text: str) -> tuple:
+    """
+    Splits the complete output of a <think> model into reasoning and answer.
+
+    Args:
+        text (str): The raw model output.
+
+    Returns
+        - reasoning (str): The text within the <think>...</think> tags.
+        - answer (str): The text after the closing tag (empty if the tag was never closed).
+    """
+    parser = ThinkTagParser()
+    parser.feed(text or "")
+    parser.close()
+    return parser.reasoning.strip(), parser.answer.strip()
+
+
+class CompletionStream:
+    """
+    Streams a Groq chat completion, separating the reasoning from the final answer.
+
+    Iterating over the object yields only the answer chunks, so it can be handed
+    straight to `st.write_stream`. Reasoning chunks are accumulated in `reasoning`
+    and forwarded to the optional `on_reasoning` callback as they arrive.
+
+    Attributes:
+        reasoning (str): The reasoning received so far.
+        content (str): The answer received so far.
+        raw_content (str): The raw `content` field received so far (may contain <think> tags).
+        ttft (float): Seconds from sending the request to receiving the first token.
+        total_time (float): Seconds from sending the request to the end of the stream.
+    """
+
+    def __init__(self, client, on_reasoning=None, **create_kwargs):
+        """
+        Args:
+            client (groq.Groq): The Groq client to use for the request.
+            on_reasoning (callable, optional): Called with the accumulated reasoning on every reasoning chunk.
+            **create_kwargs: Keyword arguments for `client.chat.completions.create`.
+        """
+        self.client = client
+        self.on_reasoning = on_reasoning
+        self.create_kwargs = create_kwargs
+        self.model = create_kwargs.get("model")
+
+        self.reasoning = ""
+        self.content = ""
+        self.raw_content = ""
+        self.ttft = None
+        self.total_time = None
+        self._answer_chunks = []
+        self._think_parser = ThinkTagParser(
+            on_reasoning=self._add_reasoning,
+            on_answer=self._answer_chunks.append,
+        )
+
+    @property
+    def model_output(self) -> str:
+        """The output to keep in the chat history (reasoning + answer)."""
+        if self.model in REASONING_FIELD_MODELS and self.reasoning:
+            return "<think>" + self.reasoning + "</think>" + "\n\n" + self.content
+        if self.model in THINK_TAG_MODELS:
+            return self.raw_content
+        return self.content
+
+    def _add_reasoning(self, text: str) -> None:
+        self.reasoning += text
+        if self.on_reasoning is not None:
+            self.on_reasoning(self.reasoning)
+
+    def _drain_answer(self):
+        while self._answer_chunks:
+            text = self._answer_chunks.pop(0)
+            self.content += text
+            yield text
+
+    def __iter__(self):
+        started_at = time.perf_counter()
+        stream = self.client.chat.completions.create(stream=True, **self.create_kwargs)
+
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                reasoning = getattr(delta, "reasoning", None)
+                text = delta.content
+
+                if self.ttft is None and (reasoning or text):
+                    self.ttft = time.perf_counter() - started_at
+
+                if reasoning:
+                    self._add_reasoning(reasoning)
+
+                if text:
+                    if self.model in THINK_TAG_MODELS:
+                        self.raw_content += text
+                        self._think_parser.feed(text)
+                        yield from self._drain_answer()
+                    else:
+                        self.content += text
+                        yield text
+        finally:
+            # ? Closing the response aborts the generation if the consumer stopped early
+            if hasattr(stream, "close"):
+                stream.close()
+
+        if self.model in THINK_TAG_MODELS:
+            self._think_parser.close()
+            yield from self._drain_answer()
+
+        self.total_time = time.perf_counter() - started_at
+        logging.info(
+            f"{self.model}: time to first token {self.ttft or self.total_time:.2f}s, "
+            f"total {self.total_time:.2f}s"
+        )
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _RaceWorker:
+    """Consumes a `CompletionStream` on a background thread, posting its events to a queue."""
+
+    def __init__(self, client, events: queue.Queue, offset: float, **create_kwargs):
+        self.model = create_kwargs.get("model")
+        self.offset = offset
+        self.cancelled = threading.Event()
+        self.stream = CompletionStream(
+            client,
+            on_reasoning=self._on_reasoning,
+            **create_kwargs,
+        )
+        self._events = events
+        self._thread = threading.Thread(
+            target=self._run, name=f"hedge-{self.model}", daemon=True
+        )
+        self._thread.start()
+
+    def _on_reasoning(self, reasoning: str) -> None:
+        if self.cancelled.is_set():
+            raise _Cancelled()
+        self._events.put((self, "reasoning", reasoning))
+
+    def _run(self) -> None:
+        try:
+            for text in self.stream:
+                if self.cancelled.is_set():
+                    break  # ? Leaving the loop closes the response of the losing request
+                self._events.put((self, "answer", text))
+        except _Cancelled:
+            pass
+        except Exception as e:
+            self._events.put((self, "error", e))
+        else:
+            self._events.put((self, "done", None))
+
+    @property
+    def latency(self) -> dict:
+        return {
+            "model": self.model,
+            "started_after": self.offset,
+            "ttft": (
+                self.offset + self.stream.ttft if self.stream.ttft is not None else None
+            ),
+        }
+
+
+class HedgedCompletionStream:
+    """
+    Races a fallback model against the selected model when the first token is late.
+
+    The request to the selected model is sent right away. If it has not produced a
+    token within `deadline` seconds (or fails before producing one), the same
+    conversation is sent to the fallback model. The first request to produce a
+    token wins and the other one is cancelled. Iterating over the object yields the
+    answer chunks of the winner, like `CompletionStream`.
+
+    Attributes:
+        model (str): The model that won the race.
+        hedged (bool): Whether the fallback request was sent.
+        latencies (list): The start offset and time to first token (both measured
+            from the start of the race) of every request sent.
+        ttft (float): Seconds from the start of the race to the first token of the winner.
+        total_time (float): Seconds from the start of the race to the end of the winning stream.
+    """
+
+    def __init__(
+        self,
+        client,
+        fallback_kwargs: dict,
+        deadline: float = 2.0,
+        on_reasoning=None,
+        **create_kwargs,
+    ):
+        """
+        Args:
+            client (groq.Groq): The Groq client to use for the requests.
+            fallback_kwargs (dict): Keyword arguments of the request to the fallback model.
+            deadline (float): Seconds to wait for the first token before hedging.
+            on_reasoning (callable, optional): Called with the accumulated reasoning of the winner.
+            **create_kwargs: Keyword arguments of the request to the selected model.
+        """
+        self.client = client
+        self.fallback_kwargs = fallback_kwargs
+        self.deadline = deadline
+        self.on_reasoning = on_reasoning
+        self.create_kwargs = create_kwargs
+        self.model = create_kwargs.get("model")
+
+        self.hedged = False
+        self.latencies = []
+        self.ttft = None
+        self.total_time = None
+        self._winner = None
+
+    @property
+    def reasoning(self) -> str:
+        return self._winner.stream.reasoning if self._winner else ""
+
+    @property
+    def content(self) -> str:
+        return self._winner.stream.content if self._winner else ""
+
+    @property
+    def model_output(self) -> str:
+        """The output of the winner to keep in the chat history (reasoning + answer)."""
+        return self._winner.stream.model_output if self._winner else ""
+
+    def __iter__(self):
+        events = queue.Queue()
+        started_at = time.perf_counter()
+        workers = [_RaceWorker(self.client, events, 0.0, **self.create_kwargs)]
+        failed = set()
+
+        def hedge():
+            self.hedged = True
+            offset = time.perf_counter() - started_at
+            logging.info(
+                f"No token from {self.model} after {offset:.2f}s, "
+                f"hedging with {self.fallback_kwargs.get('model')}"
+            )
+            workers.append(
+                _RaceWorker(self.client, events, offset, **self.fallback_kwargs)
+            )
+
+        try:
+            while True:
+                timeout = None
+                if self._winner is None and not self.hedged:
+                    timeout = max(0.0, started_at + self.deadline - time.perf_counter())
+                try:
+                    worker, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedge()
+                    continue
+
+                if self._winner is None:
+                    if kind == "error":
+                        failed.add(worker)
+                        if not self.hedged:
+                            hedge()
+                        elif len(failed) == len(workers):
+                            raise value
+                        continue
+
+                    # ? First responder wins, the others are cancelled
+                    self._winner = worker
+                    self.model = worker.model
+                    self.ttft = time.perf_counter() - started_at
+                    for other in workers:
+                        if other is not worker:
+                            other.cancelled.set()
+
+                if worker is not self._winner:
+                    continue
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    break
+                if kind == "reasoning":
+                    if self.on_reasoning is not None:
+                        self.on_reasoning(value)
+                else:
+                    yield value
+        finally:
+            for worker in workers:
+                worker.cancelled.set()
+            self.total_time = time.perf_counter() - started_at
+            self.latencies = [
+                dict(worker.latency, won=worker is self._winner) for worker in workers
+            ]
+            logging.info(f"Hedged completion latencies: {self.latencies}")
@@ -0,0 +1,6 @@
+# Function words that carry no meaning of their own, shared by the lexical matchers
+STOPWORDS = frozenset(
+    """a an the is are was were be been am do does did of in on at to for from by with
+    about and or me my i you your we us it its this that these those what whats which
+    who how please tell show give can could would should will right any some there here""".split()
+)
@@ -0,0 +1,53 @@
+import math
+
+# Context sizes (in tokens) assumed for each model across the app
+MODEL_CONTEXT_WINDOWS = {
+    "gemma2-9b-it": 8192,
+    "llama-3.1-8b-instant": 8000,
+    "llama-3.3-70b-versatile": 32768,
+    "meta-llama/llama-4-maverick-17b-128e-instruct": 8192,
+    "meta-llama/llama-4-scout-17b-16e-instruct": 8192,
+    "openai/gpt-oss-120b": 32766,
+    "openai/gpt-oss-20b": 32768,
+    "deepseek-r1-distill-llama-70b": 131072,
+    "qwen/qwen3-32b": 40960,
+    "moonshotai/kimi-k2-instruct": 16384,
+    "compound-beta": 8192,
+    "compound-beta-mini": 8192,
+    "compound-beta-oss": 8192,
+}
+
+DEFAULT_CONTEXT_WINDOW = 8192
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens in the text without running a tokenizer.
+
+    Uses the usual ~4 characters per token rule for English text, bumped up for
+    text with many short words (where tokens per word dominates).
+
+    Args:
+        text (str): The text to estimate.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    if not text:
+        return 0
+    by_chars = len(text) / 4
+    by_words = text.count(" ") * 1.3
+    return math.ceil(max(by_chars, by_words))
+
+
+def context_window(model: str) -> int:
+    """
+    Returns the context size assumed for the model.
+
+    Args:
+        model (str): The model name.
+
+    Returns:
+        int: The context size in tokens.
+    """
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)